@@ -1,14 +1,21 @@
 import cv2
-import time
+import os
+import sys
+import signal
+import argparse
+import threading
 import logging
-from threading import Thread
 from datetime import datetime
 from src import config
-from src.camera import SecurityCamera
+from src.supervisor import CameraSupervisor
 from src.notifier_enhanced import EnhancedNotifier
-from src.face_detector import FaceDetector
+from src.face_workers import FaceDetectionPool
 from src.scheduler import MonitoringSchedule
+from src.runtime_config import get_runtime_config
 from src.web_interface import WebInterface
+from src.event_recorder import wall_clock
+from src.outbox import NotificationOutbox
+from src.event_store import EventStore
 
 # Configure logging
 logging.basicConfig(
@@ -17,143 +24,146 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def clean_folder():
-    """Clean up old images."""
-    import os
-    import glob
-    files = glob.glob(f"{config.IMAGES_DIR}/*")
-    for f in files:
-        try:
-            os.remove(f)
-        except Exception as e:
-            logger.error(f"Error deleting {f}: {str(e)}")
+def handle_event(event_store, outbox, notifier, event):
+    """Store the event and queue its notification, encoded in memory."""
+    event_store.save(event)
+    attachments = [
+        notifier.encode_attachment(captured.render(), wall_clock(captured.timestamp))
+        for captured in event.frames_to_send()
+    ]
+    outbox.enqueue({
+        'detected_at': wall_clock(event.trigger_time).isoformat(),
+        'face_detected': event.face_detected,
+        'motion_direction': event.motion_direction,
+        'motion_speed': event.motion_speed,
+        'dwell_time': event.dwell_time
+    }, attachments)
 
-def main():
-    logger.info("Starting enhanced security camera system...")
+def deliver_notification(notifier, payload, attachments):
+    """Outbox handler: send a queued notification."""
+    notifier.send_notification(
+        attachments,
+        face_detected=payload['face_detected'],
+        motion_direction=payload['motion_direction'],
+        detected_at=datetime.fromisoformat(payload['detected_at']),
+        motion_speed=payload.get('motion_speed'),
+        dwell_time=payload.get('dwell_time')
+    )
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Security camera with motion and face detection.")
+    parser.add_argument('--headless', action='store_true', default=config.HEADLESS,
+                        help="Run without local preview windows (stop with SIGINT/SIGTERM)")
+    return parser.parse_args(argv)
+
+def display_available() -> bool:
+    """False where HighGUI windows cannot be opened (no X11/Wayland display)."""
+    if sys.platform.startswith('linux'):
+        return bool(os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+    return True
+
+def show_previews(supervisor):
+    """Draw each camera's newest frame with its status in a preview window."""
+    for name, pipeline in supervisor.pipelines.items():
+        latest = pipeline.latest()
+        if latest is None:
+            continue
+        # Rendered onto a copy; the pipeline may still be recording the clean frame
+        display_frame = latest.render()
+        
+        # Add status text to frame
+        status_text = "MONITORING" if pipeline.camera.monitoring_active else "WAITING FOR INACTIVITY"
+        status_color = (0, 255, 0) if pipeline.camera.monitoring_active else (0, 0, 255)
+        cv2.putText(display_frame, status_text, (10, 30),
+                   cv2.FONT_HERSHEY_SIMPLEX, 1, status_color, 2)
+        
+        # Add timestamp
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        cv2.putText(display_frame, timestamp, (10, display_frame.shape[0] - 10),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        
+        # Show frames
+        cv2.imshow(f"Security Feed - {name}", display_frame)
+
+def main(argv=None):
+    args = parse_args(argv)
+    headless = args.headless
+    if not headless and not display_available():
+        logger.warning("No display available, running headless")
+        headless = True
+    logger.info("Starting enhanced security camera system"
+                f"{' (headless)' if headless else ''}...")
     logger.info("System will start monitoring after 1 minute of inactivity")
     
+    # Shut down cleanly on Ctrl+C and on `kill`/service stop
+    stop = threading.Event()
+    def request_stop(signum, frame):
+        logger.info(f"Received {signal.Signals(signum).name}, shutting down")
+        stop.set()
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    
+    supervisor = None
+    face_pool = None
+    outbox = None
+    event_store = None
     try:
         # Initialize components
-        camera = SecurityCamera(max_retries=5)
         notifier = EnhancedNotifier()
-        face_detector = FaceDetector()
-        scheduler = MonitoringSchedule()
+        if config.FACE_DETECTION_ENABLED and config.FACE_WORKERS > 0:
+            face_pool = FaceDetectionPool()
+            face_pool.start()
+        settings = get_runtime_config()
+        scheduler = MonitoringSchedule(settings)
+        outbox = NotificationOutbox(
+            lambda payload, attachments: deliver_notification(notifier, payload, attachments)
+        )
+        outbox.start()
+        event_store = EventStore()
+        
+        # One capture/detection pipeline per camera, all feeding the same store and outbox
+        supervisor = CameraSupervisor(
+            config.CAMERA_SOURCES,
+            on_event=lambda event: handle_event(event_store, outbox, notifier, event),
+            scheduler=scheduler,
+            face_pool=face_pool,
+            settings=settings
+        )
+        supervisor.start()
         
         # Initialize web interface if enabled
         if config.WEB_INTERFACE_ENABLED:
-            web_interface = WebInterface(camera, scheduler)
+            web_interface = WebInterface(supervisor.cameras(), scheduler, camera_stats=supervisor.stats,
+                                         event_store=event_store)
             web_interface.run(host=config.WEB_HOST, port=config.WEB_PORT)
         
-        count = 1
-        last_direction = None
-        last_position = None
-        
-        while True:
-            # Check if we should be monitoring based on schedule
-            if not scheduler.is_monitoring_time():
-                time.sleep(60)  # Sleep for a minute if outside monitoring hours
+        while supervisor.running and not stop.is_set():
+            if headless:
+                stop.wait(1.0)
                 continue
-                
-            # Read and process frame
-            check, frame = camera.read_frame()
-            if not check:
-                logger.error("Failed to read frame")
-                break
-                
-            processed_frame, motion_detected, should_capture = camera.process_frame(frame)
-            
-            # Detect faces if enabled
-            face_locations = []
-            if config.FACE_DETECTION_ENABLED:
-                face_locations, processed_frame = face_detector.detect_faces(processed_frame)
-            
-            # Handle motion detection and capture
-            if should_capture:
-                logger.info(f"Motion detected! Capturing {config.TOTAL_CAPTURES} images...")
-                captured_images = []
-                motion_positions = []
-                
-                # Capture series of images
-                for i in range(config.TOTAL_CAPTURES):
-                    image_path = f"{config.IMAGES_DIR}/{count}_{i+1}.png"
-                    cv2.imwrite(image_path, processed_frame)
-                    captured_images.append(image_path)
-                    count += 1
-                    
-                    # Track motion direction
-                    if face_locations:
-                        x, y, w, h = face_locations[0]  # Use first face for tracking
-                        center = (x + w//2, y + h//2)
-                        motion_positions.append(center)
-                    
-                    # Wait for next frame
-                    time.sleep(config.CAPTURE_INTERVAL)
-                    check, frame = camera.read_frame()
-                    if check:
-                        processed_frame, _, _ = camera.process_frame(frame)
-                        if config.FACE_DETECTION_ENABLED:
-                            face_locations, processed_frame = face_detector.detect_faces(processed_frame)
-                
-                # Determine motion direction
-                motion_direction = None
-                if len(motion_positions) >= 2:
-                    start_pos = motion_positions[0]
-                    end_pos = motion_positions[-1]
-                    dx = end_pos[0] - start_pos[0]
-                    dy = end_pos[1] - start_pos[1]
-                    
-                    if abs(dx) > abs(dy):
-                        motion_direction = "right" if dx > 0 else "left"
-                    else:
-                        motion_direction = "down" if dy > 0 else "up"
-                
-                # Select middle images to send
-                if len(captured_images) >= config.TOTAL_CAPTURES:
-                    start_idx = (config.TOTAL_CAPTURES - config.IMAGES_TO_SEND) // 2
-                    end_idx = start_idx + config.IMAGES_TO_SEND
-                    images_to_send = captured_images[start_idx:end_idx]
-                    
-                    # Send notification
-                    try:
-                        notifier.send_notification(
-                            images_to_send,
-                            face_detected=bool(face_locations),
-                            motion_direction=motion_direction
-                        )
-                        # Start cleanup thread
-                        clean_thread = Thread(target=clean_folder)
-                        clean_thread.daemon = True
-                        clean_thread.start()
-                    except Exception as e:
-                        logger.error(f"Failed to send notification: {str(e)}")
-            
-            # Display frames
-            status_text = "MONITORING" if camera.monitoring_active else "WAITING FOR INACTIVITY"
-            status_color = (0, 255, 0) if camera.monitoring_active else (0, 0, 255)
-            
-            # Add status text to frame
-            cv2.putText(processed_frame, status_text, (10, 30),
-                       cv2.FONT_HERSHEY_SIMPLEX, 1, status_color, 2)
-            
-            # Add timestamp
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            cv2.putText(processed_frame, timestamp, (10, processed_frame.shape[0] - 10),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-            
-            # Show frames
-            cv2.imshow("Security Feed", processed_frame)
+            show_previews(supervisor)
             
             # Check for quit
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+            if cv2.waitKey(30) & 0xFF == ord('q'):
                 break
+        if not stop.is_set() and not supervisor.running:
+            logger.error("All camera pipelines have stopped")
                 
     except Exception as e:
         logger.error(f"An error occurred: {str(e)}")
         
     finally:
         logger.info("Cleaning up...")
-        camera.release()
-        cv2.destroyAllWindows()
+        if supervisor is not None:
+            supervisor.stop()
+        if outbox is not None:
+            outbox.stop()
+        if event_store is not None:
+            event_store.close()
+        if face_pool is not None:
+            face_pool.stop()
+        if not headless:
+            cv2.destroyAllWindows()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,185 @@
+import cv2
+import time
+import logging
+from typing import Dict, Optional, Type
+import numpy as np
+from . import config
+
+logger = logging.getLogger(__name__)
+
+class BackgroundModel:
+    """Turns a blurred grayscale frame into a binary foreground mask.
+
+    Subclasses implement `_apply`. Every call is timed so models can be
+    compared by their per-frame cost.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.frames = 0
+        self.last_cost_ms = 0.0
+        self.average_cost_ms = 0.0
+        self._shape = None
+
+    def apply(self, gray: np.ndarray, dst: np.ndarray) -> Optional[np.ndarray]:
+        """Write the foreground mask for `gray` into `dst`.
+
+        Returns `dst`, or None while the model has no reference yet.
+        """
+        start = time.perf_counter()
+        if gray.shape != self._shape:
+            self._allocate(gray.shape)
+            self._shape = gray.shape
+        mask = self._apply(gray, dst)
+        cost_ms = (time.perf_counter() - start) * 1000
+
+        self.frames += 1
+        self.last_cost_ms = cost_ms
+        # Exponential moving average keeps the figure stable without storing history
+        self.average_cost_ms += (cost_ms - self.average_cost_ms) / min(self.frames, 100)
+        return mask
+
+    def reset(self):
+        """Forget everything learned about the background."""
+        self._shape = None
+
+    def cost_summary(self) -> Dict[str, float]:
+        """Per-frame cost of this model."""
+        return {
+            'model': self.name,
+            'frames': self.frames,
+            'last_ms': round(self.last_cost_ms, 3),
+            'average_ms': round(self.average_cost_ms, 3),
+        }
+
+    def _allocate(self, shape):
+        pass
+
+    def _apply(self, gray: np.ndarray, dst: np.ndarray) -> Optional[np.ndarray]:
+        raise NotImplementedError
+
+class FrameDifferenceModel(BackgroundModel):
+    """Compare each frame with the previous one (the original behaviour)."""
+
+    name = "frame_diff"
+
+    def __init__(self, threshold: int = config.MOTION_THRESHOLD):
+        super().__init__()
+        self.threshold = threshold
+
+    def _allocate(self, shape):
+        self._previous = np.empty(shape, dtype=np.uint8)
+        self._delta = np.empty(shape, dtype=np.uint8)
+        self._has_reference = False
+
+    def _apply(self, gray, dst):
+        if not self._has_reference:
+            np.copyto(self._previous, gray)
+            self._has_reference = True
+            return None
+        cv2.absdiff(self._previous, gray, dst=self._delta)
+        cv2.threshold(self._delta, self.threshold, 255, cv2.THRESH_BINARY, dst=dst)
+        np.copyto(self._previous, gray)
+        return dst
+
+class RunningAverageModel(BackgroundModel):
+    """Compare each frame with an exponential running average of past frames.
+
+    Slow movers stay visible against the averaged background and short
+    lighting flicker is smoothed out.
+    """
+
+    name = "running_average"
+
+    def __init__(self, threshold: int = config.MOTION_THRESHOLD,
+                 alpha: float = config.RUNNING_AVERAGE_ALPHA):
+        super().__init__()
+        self.threshold = threshold
+        self.alpha = alpha
+
+    def _allocate(self, shape):
+        self._average = np.empty(shape, dtype=np.float32)
+        self._background = np.empty(shape, dtype=np.uint8)
+        self._delta = np.empty(shape, dtype=np.uint8)
+        self._has_reference = False
+
+    def _apply(self, gray, dst):
+        if not self._has_reference:
+            self._average[...] = gray
+            self._has_reference = True
+            return None
+        cv2.convertScaleAbs(self._average, dst=self._background)
+        cv2.absdiff(self._background, gray, dst=self._delta)
+        cv2.threshold(self._delta, self.threshold, 255, cv2.THRESH_BINARY, dst=dst)
+        cv2.accumulateWeighted(gray, self._average, self.alpha)
+        return dst
+
+class MOG2Model(BackgroundModel):
+    """OpenCV's Gaussian-mixture background subtractor."""
+
+    name = "mog2"
+
+    def __init__(self, history: int = config.BACKGROUND_HISTORY,
+                 var_threshold: float = config.MOG2_VAR_THRESHOLD):
+        super().__init__()
+        self.history = history
+        self.var_threshold = var_threshold
+
+    def _allocate(self, shape):
+        self._subtractor = cv2.createBackgroundSubtractorMOG2(
+            history=self.history, varThreshold=self.var_threshold, detectShadows=False
+        )
+        self._has_reference = False
+
+    def _apply(self, gray, dst):
+        self._subtractor.apply(gray, dst)
+        if not self._has_reference:
+            self._has_reference = True
+            return None
+        return dst
+
+class KNNModel(BackgroundModel):
+    """OpenCV's k-nearest-neighbours background subtractor."""
+
+    name = "knn"
+
+    def __init__(self, history: int = config.BACKGROUND_HISTORY,
+                 dist_threshold: float = config.KNN_DIST_THRESHOLD):
+        super().__init__()
+        self.history = history
+        self.dist_threshold = dist_threshold
+
+    def _allocate(self, shape):
+        self._subtractor = cv2.createBackgroundSubtractorKNN(
+            history=self.history, dist2Threshold=self.dist_threshold, detectShadows=False
+        )
+        self._has_reference = False
+
+    def _apply(self, gray, dst):
+        self._subtractor.apply(gray, dst)
+        if not self._has_reference:
+            self._has_reference = True
+            return None
+        return dst
+
+BACKGROUND_MODELS: Dict[str, Type[BackgroundModel]] = {
+    FrameDifferenceModel.name: FrameDifferenceModel,
+    RunningAverageModel.name: RunningAverageModel,
+    MOG2Model.name: MOG2Model,
+    KNNModel.name: KNNModel,
+}
+
+def create_background_model(name: str = config.BACKGROUND_MODEL,
+                            threshold: int = config.MOTION_THRESHOLD) -> BackgroundModel:
+    """Create a background model by name."""
+    if name not in BACKGROUND_MODELS:
+        raise ValueError(f"Unknown background model '{name}', "
+                         f"expected one of {sorted(BACKGROUND_MODELS)}")
+    model_class = BACKGROUND_MODELS[name]
+    if model_class in (FrameDifferenceModel, RunningAverageModel):
+        model = model_class(threshold=threshold)
+    else:
+        model = model_class()
+    logger.info(f"Using '{name}' background model")
+    return model
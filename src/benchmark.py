@@ -0,0 +1,452 @@
+"""Offline benchmark of the detection pipeline.
+
+Replays a recorded video, or a generated synthetic scene, through a
+file-backed SecurityCamera and reports per-stage throughput, latency
+percentiles, allocations and detection counts as JSON:
+
+    python -m src.benchmark --frames 600 --output bench.json
+    python -m src.benchmark --video recordings/porch.avi --motion-scale 0.5
+    python -m src.benchmark --baseline bench.json --tolerance 0.2
+    python -m src.benchmark --bus-consumers 3 --bus-fps 30
+
+With --baseline the exit status is 1 if any stage's p95 latency regressed
+by more than the tolerance. With --bus-consumers the same video is also
+published to a shared-memory frame bus and consumed by separate processes
+(motion, faces and JPEG encoding in turn), and the report gains a
+`frame_bus` section with per-consumer throughput, latency and lag, next
+to the cost of moving one frame through a pickling queue.
+"""
+import cv2
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import platform
+import multiprocessing
+import tempfile
+import tracemalloc
+import logging
+from typing import Any, Dict, List, Optional
+import numpy as np
+from . import config
+from .camera import SecurityCamera
+from .face_detector import FaceDetector
+from .detection import FACE
+from .motion import MotionEngine
+from .background_models import create_background_model
+from .tracker import MotionTracker
+from .frame_bus import FrameBusReader, SharedFrameBus
+
+logger = logging.getLogger(__name__)
+
+STAGES = ['capture', 'motion', 'tracking', 'faces', 'render', 'encode', 'total']
+BUS_ROLES = ['motion', 'faces', 'encode']
+
+def generate_scene(path: str, frames: int = 300, size=(config.FRAME_WIDTH, config.FRAME_HEIGHT),
+                   fps: float = 30, seed: int = 0) -> str:
+    """Write a synthetic scene to `path`: a noisy static background with
+    objects that move across it in bursts, separated by still periods."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    background = cv2.GaussianBlur(rng.integers(0, 120, (height, width, 3), dtype=np.uint8), (15, 15), 0)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, size)
+    if not writer.isOpened():
+        raise IOError(f"Could not open video writer for {path}")
+    objects = [
+        {'pos': rng.uniform([0, 0], [width, height]), 'vel': rng.choice([-1, 1], 2) * rng.uniform(10, 20, 2),
+         'size': int(rng.integers(80, 160)), 'color': tuple(int(c) for c in rng.integers(180, 255, 3))}
+        for _ in range(3)
+    ]
+    burst = max(1, int(fps * 3))
+    try:
+        for i in range(frames):
+            frame = background.copy()
+            # Alternate between movement and stillness so captures can trigger
+            moving = (i // burst) % 2 == 1
+            for obj in objects:
+                if moving:
+                    obj['pos'] = (obj['pos'] + obj['vel']) % [width, height]
+                    x, y = obj['pos'].astype(int)
+                    cv2.rectangle(frame, (x, y), (x + obj['size'], y + obj['size']), obj['color'], -1)
+            noise = rng.integers(-4, 5, frame.shape, dtype=np.int16)
+            writer.write(np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8))
+    finally:
+        writer.release()
+    return path
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Latency summary (milliseconds) of a list of per-frame timings in seconds."""
+    if not samples:
+        return {}
+    ms = np.asarray(samples) * 1000
+    mean = float(ms.mean())
+    return {
+        'fps': round(1000 / mean, 1) if mean > 0 else None,
+        'mean_ms': round(mean, 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'max_ms': round(float(ms.max()), 3),
+    }
+
+class PipelineBenchmark:
+    """Runs every frame of a video file through the pipeline stages and times them."""
+
+    def __init__(self, video_path: str, motion_scale: float = config.MOTION_DOWNSCALE,
+                 pyramid_levels: int = config.MOTION_PYRAMID_LEVELS,
+                 background_model: str = config.BACKGROUND_MODEL,
+                 faces: bool = config.FACE_DETECTION_ENABLED,
+                 face_stride: int = config.FACE_DETECTION_STRIDE,
+                 inactivity_timeout: float = config.INACTIVITY_TIMEOUT,
+                 track_allocations: bool = False):
+        self.video_path = video_path
+        self.faces = faces
+        self.inactivity_timeout = inactivity_timeout
+        self.track_allocations = track_allocations
+        # Every frame must be processed, so read synchronously instead of through the grabber
+        self.camera = SecurityCamera(max_retries=1, source=video_path, name="benchmark", threaded=False)
+        self.camera.motion_engine = MotionEngine(
+            scale=motion_scale, pyramid_levels=pyramid_levels,
+            background_model=create_background_model(background_model)
+        )
+        self.face_detector = FaceDetector(stride=face_stride)
+        self.tracker = MotionTracker(camera="benchmark")
+        self.settings = {
+            'motion_scale': motion_scale,
+            'pyramid_levels': pyramid_levels,
+            'background_model': background_model,
+            'faces': faces,
+            'face_stride': face_stride,
+            'face_motion_gated': config.FACE_MOTION_GATED,
+            'inactivity_timeout': inactivity_timeout,
+            'stream_jpeg_quality': config.STREAM_JPEG_QUALITY,
+        }
+        self.timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self.allocations: Dict[str, List[int]] = {stage: [] for stage in STAGES if stage != 'total'}
+        self.counts = {'frames': 0, 'motion_frames': 0, 'motion_boxes': 0, 'captures': 0,
+                       'face_frames': 0, 'faces': 0, 'tracks': 0}
+
+    def _measure(self, stage: str, func, *args):
+        """Call `func`, recording its duration and (optionally) its allocation peak."""
+        if self.track_allocations:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = func(*args)
+        self.timings[stage].append(time.perf_counter() - start)
+        if self.track_allocations:
+            self.allocations[stage].append(tracemalloc.get_traced_memory()[1] - base)
+        return result
+
+    def run(self, max_frames: Optional[int] = None, warmup: int = 5) -> Dict[str, Any]:
+        if self.track_allocations:
+            tracemalloc.start()
+        encode_params = [cv2.IMWRITE_JPEG_QUALITY, config.STREAM_JPEG_QUALITY]
+        frame_index = 0
+        wall_start = time.perf_counter()
+        try:
+            while max_frames is None or frame_index < max_frames + warmup:
+                frame_start = time.perf_counter()
+                item = self._measure('capture', self.camera.read_latest)
+                if item is None:
+                    self.timings['capture'].pop()
+                    if self.track_allocations:
+                        self.allocations['capture'].pop()
+                    break
+                result = self._measure(
+                    'motion', self.camera.process_frame, item.frame, self.inactivity_timeout,
+                    item.seq, item.timestamp
+                )
+                self._measure('tracking', self.tracker.update, self.camera.last_motion_boxes, item.timestamp)
+                if self.faces:
+                    result.add(self._measure(
+                        'faces', self.face_detector.detect_faces, item.frame,
+                        self.camera.last_motion_boxes
+                    ), FACE)
+                # What a viewer or a notification costs: boxes drawn on a copy, then JPEG
+                rendered = self._measure('render', result.render, item.frame)
+                self._measure('encode', cv2.imencode, '.jpg', rendered, encode_params)
+                self.timings['total'].append(time.perf_counter() - frame_start)
+
+                frame_index += 1
+                if frame_index <= warmup:
+                    # Drop warm-up frames (first-frame allocations, cascade loading)
+                    for samples in list(self.timings.values()) + list(self.allocations.values()):
+                        samples.clear()
+                    wall_start = time.perf_counter()
+                    continue
+                self.counts['frames'] += 1
+                face_count = int(np.count_nonzero(result.labels == FACE))
+                self.counts['motion_frames'] += int(result.motion_detected)
+                self.counts['motion_boxes'] += len(self.camera.last_motion_boxes)
+                self.counts['captures'] += int(result.should_capture)
+                self.counts['face_frames'] += int(face_count > 0)
+                self.counts['faces'] += face_count
+        finally:
+            if self.track_allocations:
+                tracemalloc.stop()
+            self.camera.release()
+        self.counts['tracks'] = len(self.tracker.summaries())
+        wall_time = time.perf_counter() - wall_start
+
+        report = {
+            'source': self.video_path,
+            'settings': self.settings,
+            'environment': {
+                'python': platform.python_version(),
+                'opencv': cv2.__version__,
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+                'processor': platform.processor() or None,
+                'cpu_count': os.cpu_count(),
+            },
+            'frames': self.counts['frames'],
+            'wall_time_s': round(wall_time, 3),
+            'pipeline_fps': round(self.counts['frames'] / wall_time, 1) if wall_time > 0 else None,
+            'stages': {stage: percentiles(samples) for stage, samples in self.timings.items() if samples},
+            'detections': self.counts,
+        }
+        if self.track_allocations:
+            report['allocations'] = {
+                stage: {
+                    'mean_peak_kb': round(float(np.mean(samples)) / 1024, 1),
+                    'max_peak_kb': round(max(samples) / 1024, 1),
+                }
+                for stage, samples in self.allocations.items() if samples
+            }
+        return report
+
+def _bus_consumer(bus_name: str, consumer_id: int, role: str, messages):
+    """Consumer process of the frame bus benchmark: run one stage on the newest frames."""
+    reader = FrameBusReader(bus_name, consumer_id)
+    if role == 'motion':
+        engine = MotionEngine(camera=f"bus-{consumer_id}")
+        stage = engine.detect
+    elif role == 'faces':
+        stage = FaceDetector(channel=f"bus-{consumer_id}").locate_faces
+    else:
+        params = [cv2.IMWRITE_JPEG_QUALITY, config.STREAM_JPEG_QUALITY]
+        stage = lambda frame: cv2.imencode('.jpg', frame, params)
+    messages.put(('ready', consumer_id, None))
+    timings, latencies = [], []
+    overwritten = 0
+    last_seq = 0
+    started = None
+    try:
+        while True:
+            item = reader.wait_for_frame(last_seq, timeout=2.0)
+            if item is None:
+                break
+            if started is None:
+                started = time.perf_counter()
+            start = time.perf_counter()
+            stage(item.frame)  # In place: the frame is a view of the shared slot
+            timings.append(time.perf_counter() - start)
+            latencies.append(time.monotonic() - item.timestamp)
+            if not reader.is_current(item):
+                overwritten += 1
+            last_seq = item.seq
+        elapsed = time.perf_counter() - started if started is not None else 0.0
+    finally:
+        reader.close()
+    messages.put(('done', consumer_id, {
+        'role': role,
+        'frames': len(timings),
+        'fps': round(len(timings) / elapsed, 1) if elapsed > 0 else None,
+        'stage': percentiles(timings),
+        'latency': percentiles(latencies),
+        'overwritten_while_processing': overwritten,
+    }))
+
+def transfer_costs(frame: np.ndarray, iterations: int = 50) -> Dict[str, float]:
+    """Milliseconds to hand one frame to another process: pickling queue vs frame bus."""
+    context = multiprocessing.get_context('spawn')
+    frames = context.Queue()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        frames.put(frame)
+        frames.get()
+    queue_ms = (time.perf_counter() - start) / iterations * 1000
+    frames.close()
+
+    bus = SharedFrameBus(frame.shape, camera="benchmark-transfer")
+    reader = FrameBusReader(bus.name)
+    try:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            reader.read(bus.publish(frame))
+        bus_ms = (time.perf_counter() - start) / iterations * 1000
+    finally:
+        reader.close()
+        bus.close()
+    return {'queue_pickle_ms': round(queue_ms, 3), 'frame_bus_ms': round(bus_ms, 3),
+            'frame_bytes': int(frame.nbytes)}
+
+def benchmark_frame_bus(video_path: str, max_frames: int, consumers: int,
+                        fps: float = 30.0, slots: int = config.FRAME_BUS_SLOTS) -> Dict[str, Any]:
+    """Publish a video to a frame bus and consume it from `consumers` processes.
+
+    Frames are published at `fps` (0 = as fast as they decode); each
+    consumer always takes the newest frame, so a slow one skips frames
+    rather than falling further behind.
+    """
+    video = cv2.VideoCapture(video_path)
+    ret, frame = video.read()
+    if not ret:
+        raise IOError(f"Could not read {video_path}")
+    context = multiprocessing.get_context('spawn')
+    messages = context.Queue()
+    bus = SharedFrameBus(frame.shape, slots=slots, camera="benchmark")
+    processes = []
+    results = {}
+    try:
+        ids = {}
+        for i in range(consumers):
+            role = BUS_ROLES[i % len(BUS_ROLES)]
+            name = f"{role}-{i}"
+            ids[name] = bus.add_consumer(name)
+            process = context.Process(target=_bus_consumer, args=(bus.name, ids[name], role, messages),
+                                      name=f"BusConsumer-{name}")
+            process.daemon = True
+            process.start()
+            processes.append(process)
+        for _ in processes:
+            messages.get(timeout=60)  # ready
+
+        interval = 1.0 / fps if fps else 0.0
+        max_lag = dict.fromkeys(ids, 0)
+        published = 0
+        publish_times = []
+        wall_start = time.perf_counter()
+        next_due = time.monotonic()
+        while ret and published < max_frames:
+            if interval:
+                delay = next_due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_due += interval
+            start = time.perf_counter()
+            bus.publish(frame)
+            publish_times.append(time.perf_counter() - start)
+            published += 1
+            for name, consumer_id in ids.items():
+                max_lag[name] = max(max_lag[name], bus.lag(consumer_id))
+            ret, frame = video.read()
+        wall_time = time.perf_counter() - wall_start
+
+        # Let the consumers finish the frame they are on, then close the bus to stop them
+        deadline = time.monotonic() + 5.0
+        while any(bus.lag(i) for i in ids.values()) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        consumer_state = bus.consumers()
+    finally:
+        bus.close()
+        video.release()
+        try:
+            while len(results) < len(processes):
+                _, consumer_id, result = messages.get(timeout=10)
+                results[consumer_id] = result
+        except queue.Empty:
+            logger.warning("Not every frame bus consumer reported its results")
+        for process in processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+
+    report = {
+        'frames_published': published,
+        'publish_fps': round(published / wall_time, 1) if wall_time > 0 else None,
+        'target_fps': fps or None,
+        'slots': slots,
+        'publish': percentiles(publish_times),
+        'consumers': {},
+    }
+    for name, consumer_id in ids.items():
+        entry = dict(results.get(consumer_id, {}))
+        entry.update(skipped=consumer_state[name]['skipped'], max_lag=max_lag[name])
+        report['consumers'][name] = entry
+    return report
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Stages whose p95 latency is more than `tolerance` (a fraction) above the baseline."""
+    regressions = []
+    for stage, stats in report['stages'].items():
+        before = baseline.get('stages', {}).get(stage, {}).get('p95_ms')
+        if before and stats['p95_ms'] > before * (1 + tolerance):
+            regressions.append(f"{stage}: p95 {stats['p95_ms']} ms vs {before} ms baseline")
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the detection pipeline on a video file.")
+    parser.add_argument('--video', help="Recorded video to replay (default: generate a synthetic scene)")
+    parser.add_argument('--frames', type=int, default=300, help="Frames to process (and to generate)")
+    parser.add_argument('--warmup', type=int, default=5, help="Leading frames excluded from the results")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic scene")
+    parser.add_argument('--motion-scale', type=float, default=config.MOTION_DOWNSCALE)
+    parser.add_argument('--pyramid-levels', type=int, default=config.MOTION_PYRAMID_LEVELS)
+    parser.add_argument('--background-model', default=config.BACKGROUND_MODEL)
+    parser.add_argument('--face-stride', type=int, default=config.FACE_DETECTION_STRIDE)
+    parser.add_argument('--inactivity-timeout', type=float, default=0.0,
+                        help="Seconds of stillness before motion triggers a capture. Replay runs "
+                             "faster than real time, so the default 0 keeps capture counts deterministic")
+    parser.add_argument('--no-faces', action='store_true', help="Skip the face detection stage")
+    parser.add_argument('--allocations', action='store_true',
+                        help="Track per-stage allocation peaks with tracemalloc (slows timings)")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="Earlier report to compare p95 latencies against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed p95 slowdown against the baseline (0.2 = 20%%)")
+    parser.add_argument('--bus-consumers', type=int, default=0,
+                        help="Also run the frame bus benchmark with this many consumer processes")
+    parser.add_argument('--bus-fps', type=float, default=30.0,
+                        help="Publishing rate of the frame bus benchmark (0 = as fast as frames decode)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    temp_dir = None
+    video_path = args.video
+    if video_path is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        # One extra frame for the test read made when the camera is opened
+        video_path = generate_scene(os.path.join(temp_dir.name, 'synthetic.avi'),
+                                    frames=args.frames + args.warmup + 1, seed=args.seed)
+    try:
+        report = PipelineBenchmark(
+            video_path, motion_scale=args.motion_scale, pyramid_levels=args.pyramid_levels,
+            background_model=args.background_model, faces=not args.no_faces,
+            face_stride=args.face_stride, inactivity_timeout=args.inactivity_timeout,
+            track_allocations=args.allocations
+        ).run(max_frames=args.frames, warmup=args.warmup)
+        if args.bus_consumers > 0:
+            report['frame_bus'] = benchmark_frame_bus(video_path, args.frames + args.warmup,
+                                                      args.bus_consumers, fps=args.bus_fps)
+            capture = cv2.VideoCapture(video_path)
+            ret, frame = capture.read()
+            capture.release()
+            if ret:
+                report['frame_bus']['transfer'] = transfer_costs(frame)
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+    if args.video is None:
+        report['source'] = f"synthetic (seed {args.seed})"
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,118 +1,184 @@
 import cv2
+import os
 import time
+import threading
 from typing import Tuple, Optional
 import numpy as np
 from . import config
+from .capture import FrameGrabber, TimestampedFrame
+from .frame_bus import SharedFrameBus
+from .camera_discovery import capture_backend, discover_camera, remember_device
+from .motion import MotionEngine
+from .detection import MOTION, DetectionResult
 import logging
 
 logger = logging.getLogger(__name__)
 
 class SecurityCamera:
-    def __init__(self, max_retries=5):
-        self.first_frame = None
+    def __init__(self, max_retries=5, source=None, name="camera0", threaded: Optional[bool] = None):
+        """Open a camera source.
+        
+        `source` may be a device index, a video file path or a stream URL.
+        If it is None the first working device is used. `threaded`
+        (default CAPTURE_THREADED) grabs frames on a dedicated thread.
+        """
+        self.name = name
+        self.threaded = config.CAPTURE_THREADED if threaded is None else threaded
+        self.motion_engine = MotionEngine(camera=name)
+        self.last_motion_boxes = []
         self.last_motion_time = time.time()
         self.monitoring_active = False
         self.inactivity_start_time = None
+        self.grabber = None
+        self.frame_bus = None
+        self._sync_seq = 0
+        self._reader_state = threading.local()
         
         # Initialize camera with retries
-        logger.info("Initializing camera...")
+        started = time.perf_counter()
+        logger.info(f"Initializing camera {name}...")
         self.video = None
+        self.startup_ms = None
+        backend = capture_backend()
+        discovered = source is None
         
-        # Try to list available cameras
-        available_ports = []
-        for i in range(10):
-            cap = cv2.VideoCapture(i + cv2.CAP_DSHOW)
-            if cap.isOpened():
-                ret, frame = cap.read()
-                if ret and frame is not None:
-                    available_ports.append(i)
-                    logger.info(f"Found working camera at index {i}")
-                cap.release()
-        
-        if not available_ports:
-            raise Exception("No working cameras found")
-        
-        logger.info(f"Available camera ports: {available_ports}")
+        if discovered:
+            # Use the cached device, or probe until the first working one
+            source, self.video, _ = discover_camera(name, backend)
+            
+        self.source = source
+        self.is_device = isinstance(source, int)
+        self.is_file = not self.is_device and os.path.isfile(source)
         
-        # Try to use the first available camera
+        retry_delay = config.CAMERA_RETRY_DELAY
         for attempt in range(max_retries):
             try:
-                camera_index = available_ports[0]  # Use the first working camera
-                logger.info(f"Trying camera index {camera_index} with DirectShow, attempt {attempt + 1}")
-                self.video = cv2.VideoCapture(camera_index + cv2.CAP_DSHOW)
+                if self.video is None:
+                    logger.info(f"Trying camera source {source}, attempt {attempt + 1}")
+                    if self.is_device:
+                        self.video = cv2.VideoCapture(source, backend)
+                    else:
+                        self.video = cv2.VideoCapture(source)
                 
                 if not self.video.isOpened():
                     raise Exception("Failed to open camera")
                 
-                # Set camera properties
-                self.video.set(cv2.CAP_PROP_FRAME_WIDTH, config.FRAME_WIDTH)
-                self.video.set(cv2.CAP_PROP_FRAME_HEIGHT, config.FRAME_HEIGHT)
+                # Set camera properties (files and streams keep their own)
+                if self.is_device:
+                    self._configure_capture()
                 
                 # Try to read a test frame
                 ret, frame = self.video.read()
                 if not ret or frame is None:
                     raise Exception("Failed to read test frame")
                 
-                logger.info(f"Successfully initialized camera with index {camera_index}")
+                self.startup_ms = (time.perf_counter() - started) * 1000
+                logger.info(f"Successfully initialized camera {name} with source {source}, "
+                            f"first frame after {self.startup_ms:.0f} ms")
+                if discovered:
+                    remember_device(name, source, backend)
+                if config.FRAME_BUS_ENABLED:
+                    # Shared-memory copy of every frame for consumer processes
+                    self.frame_bus = SharedFrameBus(frame.shape, camera=name)
+                if self.threaded:
+                    # Files are replayed at their own frame rate instead of as fast as they decode
+                    pace_fps = (self.video.get(cv2.CAP_PROP_FPS) or 30) if self.is_file else None
+                    self.grabber = FrameGrabber(self.video, ring_size=config.FRAME_RING_SIZE,
+                                                pace_fps=pace_fps, name=name, bus=self.frame_bus)
+                    self.grabber.start()
                 return
                 
             except Exception as e:
-                logger.warning(f"Camera index {camera_index}, attempt {attempt + 1} failed: {str(e)}")
+                logger.warning(f"Camera source {source}, attempt {attempt + 1} failed: {str(e)}")
                 if self.video is not None:
                     self.video.release()
-                time.sleep(2)  # Wait before retrying
+                    self.video = None
+                if attempt + 1 < max_retries:
+                    time.sleep(retry_delay)  # Wait before retrying
+                    retry_delay = min(retry_delay * 2, config.CAMERA_RETRY_MAX_DELAY)
         
         raise Exception("Failed to initialize camera after multiple attempts")
         
-    def read_frame(self) -> Tuple[bool, Optional[np.ndarray]]:
-        """Read a frame from the camera."""
+    def _configure_capture(self):
+        """Apply pixel format, frame rate, buffer size and resolution to the device."""
+        # Pixel format has to be set before the resolution on most backends
+        if config.CAPTURE_FOURCC:
+            self.video.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*config.CAPTURE_FOURCC))
+        if config.CAPTURE_FPS:
+            self.video.set(cv2.CAP_PROP_FPS, config.CAPTURE_FPS)
+        if config.CAPTURE_BUFFER_SIZE:
+            self.video.set(cv2.CAP_PROP_BUFFERSIZE, config.CAPTURE_BUFFER_SIZE)
+        self.video.set(cv2.CAP_PROP_FRAME_WIDTH, config.FRAME_WIDTH)
+        self.video.set(cv2.CAP_PROP_FRAME_HEIGHT, config.FRAME_HEIGHT)
+        logger.info(
+            f"Capture configured: {int(self.video.get(cv2.CAP_PROP_FRAME_WIDTH))}x"
+            f"{int(self.video.get(cv2.CAP_PROP_FRAME_HEIGHT))} "
+            f"@ {self.video.get(cv2.CAP_PROP_FPS):.1f} fps"
+        )
+        
+    def read_latest(self) -> Optional[TimestampedFrame]:
+        """Read the newest frame not yet seen by the calling thread.
+        
+        In threaded mode every calling thread gets the most recent frame from
+        the grabber's ring buffer, so several consumers never steal frames
+        from each other. Returns None on failure.
+        """
+        if self.grabber is not None:
+            last_seq = getattr(self._reader_state, 'last_seq', 0)
+            item = self.grabber.wait_for_frame(last_seq, timeout=config.FRAME_READ_TIMEOUT)
+            if item is None:
+                logger.error("No new frame from capture thread")
+                return None
+            self._reader_state.last_seq = item.seq
+            return item
+            
         if not self.video or not self.video.isOpened():
             logger.error("Camera is not initialized or has been closed")
-            return False, None
+            return None
             
         ret, frame = self.video.read()
         if not ret or frame is None:
             logger.error("Failed to read frame from camera")
-            return False, None
+            return None
             
-        return True, frame
+        self._sync_seq += 1
+        item = TimestampedFrame(self._sync_seq, time.monotonic(), frame)
+        if self.frame_bus is not None:
+            self.frame_bus.publish(frame, item.timestamp, item.seq)
+        return item
         
-    def process_frame(self, frame: np.ndarray) -> Tuple[np.ndarray, bool, bool]:
+    def read_frame(self) -> Tuple[bool, Optional[np.ndarray]]:
+        """Read a frame from the camera."""
+        item = self.read_latest()
+        if item is None:
+            return False, None
+        return True, item.frame
+        
+    def process_frame(self, frame: np.ndarray, inactivity_timeout: Optional[float] = None,
+                      seq: int = 0, timestamp: Optional[float] = None) -> DetectionResult:
         """Process frame for motion detection.
-        Returns:
-            - processed_frame: Frame with detection rectangles
-            - motion_detected: Whether motion was detected
-            - should_capture: Whether this motion should trigger a capture
+        `inactivity_timeout` defaults to config.INACTIVITY_TIMEOUT. The frame
+        is not drawn on; the motion boxes come back in the result, together
+        with whether motion was detected and whether it should trigger a
+        capture.
         """
-        motion_detected = False
-        should_capture = False
-        processed_frame = frame.copy()
+        result = DetectionResult(seq, time.monotonic() if timestamp is None else timestamp)
         current_time = time.time()
-        
-        # Convert to grayscale and apply Gaussian blur
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        gray_frame_gau = cv2.GaussianBlur(gray_frame, config.GAUSSIAN_BLUR_SIZE, 0)
-        
-        # Initialize first frame if needed
-        if self.first_frame is None:
-            self.first_frame = gray_frame_gau
-            return processed_frame, motion_detected, should_capture
-            
-        # Calculate frame difference
-        delta_frame = cv2.absdiff(self.first_frame, gray_frame_gau)
-        thresh_frame = cv2.threshold(delta_frame, config.MOTION_THRESHOLD, 255, cv2.THRESH_BINARY)[1]
-        dil_frame = cv2.dilate(thresh_frame, None, iterations=2)
-        
-        # Find contours
-        contours, _ = cv2.findContours(dil_frame, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        for contour in contours:
-            if cv2.contourArea(contour) < config.MIN_CONTOUR_AREA:
-                continue
-                
-            motion_detected = True
-            x, y, w, h = cv2.boundingRect(contour)
-            cv2.rectangle(processed_frame, (x, y), (x + w, y + h), (0, 255, 0), 3)
+        if inactivity_timeout is None:
+            inactivity_timeout = config.INACTIVITY_TIMEOUT
+        
+        # Detect motion on the reduced-resolution pipeline
+        motion_boxes = self.motion_engine.detect(frame)
+        if motion_boxes is None:
+            self.last_motion_boxes = []
+            return result
+        self.last_motion_boxes = motion_boxes
+        motion_detected = len(motion_boxes) > 0
+        if motion_detected:
+            # Score each box by the share of the frame it covers
+            frame_area = float(frame.shape[0] * frame.shape[1])
+            result.add(motion_boxes, MOTION, [w * h / frame_area for (_, _, w, h) in motion_boxes])
+        result.motion_detected = motion_detected
         
         # Update motion timing
         if motion_detected:
@@ -126,21 +192,38 @@ class SecurityCamera:
         # Check if we should start monitoring
         if not self.monitoring_active:
             if (self.inactivity_start_time is not None and 
-                current_time - self.inactivity_start_time >= config.INACTIVITY_TIMEOUT):
+                current_time - self.inactivity_start_time >= inactivity_timeout):
                 logger.info("No motion for 1 minute. Monitoring activated!")
                 self.monitoring_active = True
         
         # Determine if we should capture this motion
         if motion_detected and self.monitoring_active:
-            should_capture = True
+            result.should_capture = True
             self.monitoring_active = False  # Reset monitoring after capture
             logger.info("Motion detected after inactivity period! Capturing images.")
             
-        self.first_frame = gray_frame_gau
-        return processed_frame, motion_detected, should_capture
+        return result
         
+    def pause_capture(self):
+        """Stop grabbing frames while nothing analyses them (threaded capture only)."""
+        if self.grabber is not None:
+            self.grabber.pause()
+
+    def resume_capture(self):
+        if self.grabber is not None:
+            self.grabber.resume()
+
+    def want_frames(self, consumer: str, wanted: bool = True):
+        """Keep frames coming for `consumer` (a stream viewer) even while capture is paused."""
+        if self.grabber is not None:
+            self.grabber.want(consumer, wanted)
+
     def release(self):
         """Release the camera resources."""
+        logger.info(f"Background model cost: {self.motion_engine.background_model.cost_summary()}")
+        if self.grabber is not None:
+            self.grabber.stop()
+        if self.frame_bus is not None:
+            self.frame_bus.close()
         if self.video is not None:
             self.video.release()
-        cv2.destroyAllWindows()
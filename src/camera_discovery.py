@@ -0,0 +1,140 @@
+import cv2
+import os
+import sys
+import json
+import threading
+import logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Preferred capture backend per platform
+PLATFORM_BACKENDS = {
+    'linux': cv2.CAP_V4L2,
+    'win32': cv2.CAP_DSHOW,
+    'darwin': cv2.CAP_AVFOUNDATION,
+}
+
+BACKENDS = {
+    'any': cv2.CAP_ANY,
+    'v4l2': cv2.CAP_V4L2,
+    'dshow': cv2.CAP_DSHOW,
+    'msmf': cv2.CAP_MSMF,
+    'avfoundation': cv2.CAP_AVFOUNDATION,
+}
+
+SYSFS_VIDEO_DIR = "/sys/class/video4linux"
+
+_cache_lock = threading.Lock()
+
+def capture_backend(name: str = config.CAPTURE_BACKEND) -> int:
+    """Backend to open devices with: `name` from BACKENDS, or "auto" for the platform default."""
+    if name != "auto":
+        try:
+            return BACKENDS[name]
+        except KeyError:
+            raise ValueError(f"Unknown capture backend '{name}', expected one of {list(BACKENDS)}")
+    platform = 'linux' if sys.platform.startswith('linux') else sys.platform
+    return PLATFORM_BACKENDS.get(platform, cv2.CAP_ANY)
+
+def device_identity(index: int) -> Optional[str]:
+    """A stable identity for a device index (its bus path and name), if the OS exposes one.
+
+    Only Linux exposes this (through sysfs); elsewhere None is returned and
+    devices are identified by index alone.
+    """
+    device_dir = os.path.join(SYSFS_VIDEO_DIR, f"video{index}")
+    if not os.path.isdir(device_dir):
+        return None
+    try:
+        with open(os.path.join(device_dir, 'name')) as f:
+            name = f.read().strip()
+    except OSError:
+        name = ""
+    bus_path = os.path.realpath(os.path.join(device_dir, 'device'))
+    return f"{bus_path}:{name}"
+
+def candidate_indexes(max_index: int = config.CAMERA_PROBE_MAX_INDEX) -> List[int]:
+    """Device indexes worth probing, in order.
+
+    With sysfs only indexes that actually exist are returned, so missing
+    devices are never opened; otherwise every index up to `max_index`.
+    """
+    if os.path.isdir(SYSFS_VIDEO_DIR):
+        indexes = []
+        for entry in os.listdir(SYSFS_VIDEO_DIR):
+            if entry.startswith('video') and entry[5:].isdigit():
+                indexes.append(int(entry[5:]))
+        return sorted(indexes)
+    return list(range(max_index))
+
+def try_open(index: int, backend: int) -> Tuple[Optional[cv2.VideoCapture], Optional[np.ndarray]]:
+    """Open a device and read one frame. Returns (capture, frame), or (None, None) if unusable."""
+    cap = cv2.VideoCapture(index, backend)
+    if cap.isOpened():
+        ret, frame = cap.read()
+        if ret and frame is not None:
+            return cap, frame
+    cap.release()
+    return None, None
+
+def _load_cache(path: str) -> Dict[str, Dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def remember_device(name: str, index: int, backend: int, path: str = config.CAMERA_DISCOVERY_CACHE):
+    """Record which device `name` used, so the next start can open it directly."""
+    with _cache_lock:
+        cache = _load_cache(path)
+        cache[name] = {'index': index, 'backend': backend, 'identity': device_identity(index)}
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(cache, f, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write camera discovery cache: {str(e)}")
+
+def cached_index(name: str, backend: int, path: str = config.CAMERA_DISCOVERY_CACHE) -> Optional[int]:
+    """Index of the device `name` used last time, following it if it was renumbered."""
+    with _cache_lock:
+        entry = _load_cache(path).get(name)
+    if not entry or entry.get('backend') != backend:
+        return None
+    identity = entry.get('identity')
+    if identity is None or device_identity(entry['index']) == identity:
+        return entry['index']
+    # Same device may have come back under another index after a reboot
+    for index in candidate_indexes():
+        if device_identity(index) == identity:
+            return index
+    return None
+
+def discover_camera(name: str, backend: int) -> Tuple[int, cv2.VideoCapture, np.ndarray]:
+    """Find a working device for camera `name`.
+
+    The cached device is tried first; otherwise candidates are probed in
+    order and probing stops at the first one that delivers a frame. The
+    capture is returned still open, with the frame it produced. The caller
+    records the device with `remember_device` once it is fully set up.
+    """
+    index = cached_index(name, backend)
+    if index is not None:
+        cap, frame = try_open(index, backend)
+        if cap is not None:
+            logger.info(f"Opened cached camera device {index} for {name}")
+            return index, cap, frame
+        logger.info(f"Cached camera device {index} for {name} is not usable, probing")
+
+    for index in candidate_indexes():
+        cap, frame = try_open(index, backend)
+        if cap is not None:
+            logger.info(f"Found working camera at index {index}")
+            return index, cap, frame
+
+    raise Exception("No working cameras found")
@@ -0,0 +1,192 @@
+import cv2
+import time
+import threading
+import logging
+from collections import Counter, deque
+from typing import List, NamedTuple, Optional
+import numpy as np
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+class TimestampedFrame(NamedTuple):
+    """A captured frame tagged with its sequence number and grab time."""
+    seq: int
+    timestamp: float  # time.monotonic() at the moment the frame was grabbed
+    frame: np.ndarray
+
+class FrameGrabber:
+    """Owns a VideoCapture and continuously grabs frames on a dedicated thread.
+
+    Frames are published into a small ring buffer so consumers always see the
+    newest frame, no matter how slow they are. Nothing downstream ever blocks
+    the device, so stale frames never pile up in the driver buffer. With a
+    `bus` (a SharedFrameBus) every frame is also published to shared memory
+    under the same sequence number, for consumers in other processes.
+
+    A paused grabber stops reading (and decoding) frames until it is
+    resumed, unless some consumer still asks for frames with `want`.
+    """
+
+    def __init__(self, video: cv2.VideoCapture, ring_size: int = 4, max_failures: int = 30,
+                 pace_fps: Optional[float] = None, name: str = "camera0", bus=None):
+        self.video = video
+        self.name = name
+        self.bus = bus
+        # Sources that are not real time (files) are throttled to this rate
+        self.pace_interval = 1.0 / pace_fps if pace_fps else 0.0
+        self.max_failures = max_failures
+        self.failed_reads = 0
+        self.cpu_seconds = 0.0  # CPU time used by the grabber thread
+        self._ring = deque(maxlen=max(1, ring_size))
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._running = False
+        self._paused = False
+        self._wanted_by = Counter()  # Consumer -> outstanding want() calls
+        self._thread = None
+        self._read_time = REGISTRY.histogram(
+            'pipeline_stage_seconds', "Time spent in each pipeline stage", camera=name, stage='capture'
+        )
+        self._failures = REGISTRY.counter(
+            'capture_failed_reads_total', "Frame reads that returned no frame", camera=name
+        )
+        self._frames = REGISTRY.counter('capture_frames_total', "Frames grabbed from the source", camera=name)
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    @property
+    def seq(self) -> int:
+        """Sequence number of the newest published frame (0 if none yet)."""
+        return self._seq
+
+    def start(self):
+        """Start the grabber thread."""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"FrameGrabber-{self.name}")
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info("Frame grabber thread started")
+
+    def stop(self, timeout: float = 2.0):
+        """Stop the grabber thread and wake up any waiting consumers."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def idle(self) -> bool:
+        """True while paused and no consumer wants frames."""
+        return self._paused and not self._wanted_by
+
+    def pause(self):
+        """Stop reading frames until `resume` (consumers in `want` keep it going)."""
+        with self._cond:
+            if not self._paused:
+                self._paused = True
+                logger.info(f"Frame grabber {self.name} paused")
+
+    def resume(self):
+        with self._cond:
+            if self._paused:
+                self._paused = False
+                logger.info(f"Frame grabber {self.name} resumed")
+                self._cond.notify_all()
+
+    def want(self, consumer: str, wanted: bool = True):
+        """Register (or withdraw) a consumer that needs frames even while paused.
+
+        Calls are counted, so a consumer wanted by two callers stays until
+        both have withdrawn it.
+        """
+        with self._cond:
+            if wanted:
+                self._wanted_by[consumer] += 1
+                self._cond.notify_all()
+            elif self._wanted_by[consumer] > 1:
+                self._wanted_by[consumer] -= 1
+            else:
+                self._wanted_by.pop(consumer, None)
+
+    def _run(self):
+        consecutive_failures = 0
+        next_due = time.monotonic()
+        cpu_mark = time.thread_time()
+        while self._running:
+            if self.idle:
+                with self._cond:
+                    self._cond.wait_for(lambda: not self.idle or not self._running)
+                next_due = time.monotonic()
+                continue
+            if self.pace_interval:
+                delay = next_due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_due = max(next_due + self.pace_interval, time.monotonic() - self.pace_interval)
+            start = time.perf_counter()
+            ret, frame = self.video.read()
+            timestamp = time.monotonic()
+            self._read_time.observe(time.perf_counter() - start)
+            if not ret or frame is None:
+                self.failed_reads += 1
+                self._failures.inc()
+                consecutive_failures += 1
+                if consecutive_failures >= self.max_failures:
+                    logger.error(f"Frame grabber stopping after {consecutive_failures} failed reads")
+                    break
+                time.sleep(0.01)
+                continue
+
+            consecutive_failures = 0
+            self._frames.inc()
+            # Only this thread assigns sequence numbers, so the next one is known up front
+            seq = self._seq + 1
+            if self.bus is not None:
+                # Publish before consumers are woken: a frame reference they pass
+                # on to other processes must already be in its shared slot
+                try:
+                    self.bus.publish(frame, timestamp, seq)
+                except ValueError as e:
+                    logger.warning(f"Frame {seq} not published to the frame bus: {str(e)}")
+            with self._cond:
+                self._seq = seq
+                self._ring.append(TimestampedFrame(seq, timestamp, frame))
+                self._cond.notify_all()
+            cpu = time.thread_time()
+            self.cpu_seconds += cpu - cpu_mark
+            cpu_mark = cpu
+
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def latest(self) -> Optional[TimestampedFrame]:
+        """Return the newest frame without waiting."""
+        with self._cond:
+            return self._ring[-1] if self._ring else None
+
+    def wait_for_frame(self, after_seq: int = 0, timeout: float = 1.0) -> Optional[TimestampedFrame]:
+        """Wait for a frame newer than `after_seq` and return the newest one.
+
+        Returns None on timeout or if the grabber has stopped.
+        """
+        with self._cond:
+            self._cond.wait_for(
+                lambda: (self._ring and self._ring[-1].seq > after_seq) or not self._running,
+                timeout
+            )
+            if self._ring and self._ring[-1].seq > after_seq:
+                return self._ring[-1]
+            return None
+
+    def frames(self) -> List[TimestampedFrame]:
+        """Return a snapshot of the ring buffer, oldest first."""
+        with self._cond:
+            return list(self._ring)
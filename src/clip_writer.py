@@ -0,0 +1,92 @@
+import cv2
+import os
+import queue
+import threading
+import logging
+from typing import Optional, Tuple
+import numpy as np
+from . import config
+
+logger = logging.getLogger(__name__)
+
+class ClipWriter:
+    """Encodes frames into a compressed video clip on a background thread.
+
+    `write` only puts the frame on a bounded queue, so memory use is capped
+    at `queue_size` frames; when the encoder falls behind, new frames are
+    dropped instead of stalling the caller. If encoding fails the clip is
+    abandoned, but the queue keeps being drained so `close` never hangs.
+    """
+
+    def __init__(self, path: str, fps: float, frame_size: Tuple[int, int],
+                 codec: str = config.CLIP_CODEC, queue_size: int = config.CLIP_QUEUE_SIZE):
+        self.path = path
+        self.fps = fps
+        self.frame_size = frame_size  # (width, height)
+        self.frames_written = 0
+        self.dropped = 0
+        self.failed = False
+        self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, frame_size)
+        if not self._writer.isOpened() and codec != 'MJPG':
+            logger.warning(f"Codec {codec} not available, falling back to MJPG")
+            self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, frame_size)
+        if not self._writer.isOpened():
+            raise IOError(f"Could not open video writer for {path}")
+        self._writer.set(cv2.VIDEOWRITER_PROP_QUALITY, config.CLIP_QUALITY)
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._thread = threading.Thread(target=self._run, name="ClipWriter")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, frame: np.ndarray) -> bool:
+        """Queue a frame for encoding. The caller must not modify it afterwards."""
+        if self.failed:
+            return False
+        try:
+            self._queue.put_nowait(frame)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self, timeout: float = config.CLIP_CLOSE_TIMEOUT) -> Optional[str]:
+        """Finish encoding and return the clip path, or None if it is empty or failed.
+
+        Waits at most `timeout` seconds for the encoder to catch up.
+        """
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error(f"Clip {self.path}: encoder did not finish within {timeout:.0f}s, clip abandoned")
+            self.failed = True
+            return None
+        if self.dropped:
+            logger.warning(f"Clip {self.path}: dropped {self.dropped} frames")
+        if self.failed or not self.frames_written:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return None
+        return self.path
+
+    def _run(self):
+        try:
+            while True:
+                frame = self._queue.get()
+                if frame is None:
+                    break
+                if self.failed:
+                    # Keep draining so close() can always hand over its sentinel
+                    continue
+                try:
+                    if (frame.shape[1], frame.shape[0]) != self.frame_size:
+                        frame = cv2.resize(frame, self.frame_size)
+                    self._writer.write(frame)
+                    self.frames_written += 1
+                except Exception as e:
+                    logger.error(f"Clip {self.path}: encoding failed: {str(e)}")
+                    self.failed = True
+        finally:
+            self._writer.release()
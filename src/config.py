@@ -8,40 +8,138 @@ load_dotenv()
 CAMERA_INDEX = 0
 FRAME_WIDTH = 640
 FRAME_HEIGHT = 480
+CAPTURE_BACKEND = "auto"  # "auto" picks V4L2 on Linux, DirectShow on Windows, AVFoundation on macOS
+CAMERA_PROBE_MAX_INDEX = 10  # Indexes probed when the OS cannot list its video devices
+CAMERA_DISCOVERY_CACHE = "camera_cache.json"  # Remembers which device each camera used
+CAMERA_RETRY_DELAY = 0.25  # Seconds before the first open retry, doubled on every failure
+CAMERA_RETRY_MAX_DELAY = 2.0  # Upper bound for the retry delay
+
+# Multi-Camera Configuration
+def _parse_camera_sources(value):
+    """Parse "front=0,back=rtsp://host/stream" into {name: source}; indexes become ints."""
+    sources = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        name, _, source = item.partition('=')
+        source = source.strip()
+        sources[name.strip()] = int(source) if source.isdigit() else source
+    return sources
+
+# Camera name -> device index, video file or stream URL (None = first working device)
+CAMERA_SOURCES = _parse_camera_sources(os.getenv('CAMERA_SOURCES', '')) or {"camera0": None}
+CAMERA_MAX_FPS = 15  # Upper bound on frames each camera pipeline processes per second
+ANALYSIS_IDLE_FPS = 2  # Analysis rate while the scene is quiet (0 = no limit)
+ANALYSIS_ACTIVE_HOLD = 10  # Seconds to stay at full rate after the last motion
+CAMERA_CPU_BUDGET = 50.0  # Per-camera CPU share (percent of one core) before a warning is logged
+CAMERA_STATS_INTERVAL = 60  # Seconds between per-camera fps/CPU log lines
+
+# Capture Thread Configuration
+CAPTURE_THREADED = True  # Grab frames on a dedicated thread instead of in the main loop
+CAPTURE_BUFFER_SIZE = 1  # Driver-side frame queue length (keep small for low latency)
+CAPTURE_FOURCC = "MJPG"  # Requested pixel format, or None to keep the driver default
+CAPTURE_FPS = 30  # Requested capture frame rate, or None to keep the driver default
+FRAME_RING_SIZE = 4  # Number of recent frames kept by the grabber thread
+FRAME_READ_TIMEOUT = 2.0  # Seconds to wait for a new frame before giving up
+FRAME_BUS_ENABLED = False  # Also publish captured frames to shared memory for consumer processes
+FRAME_BUS_SLOTS = 8  # Frames kept in each camera's shared-memory ring
+FRAME_BUS_MAX_CONSUMERS = 8  # Consumer cursors per frame bus
+FRAME_BUS_POLL_INTERVAL = 0.002  # Seconds between checks of a consumer waiting for a new frame
 
 # Motion Detection Configuration
 MOTION_THRESHOLD = 60
 MIN_CONTOUR_AREA = 3000
 GAUSSIAN_BLUR_SIZE = (21, 21)
+MOTION_DOWNSCALE = 1.0  # Run motion detection on a frame resized by this factor (0 < x <= 1)
+MOTION_PYRAMID_LEVELS = 0  # If > 0, use this pyramid level instead (each level halves resolution)
+BACKGROUND_MODEL = "frame_diff"  # One of: frame_diff, running_average, mog2, knn
+RUNNING_AVERAGE_ALPHA = 0.05  # Learning rate of the running_average model
+BACKGROUND_HISTORY = 500  # Frames of history for the mog2 and knn models
+MOG2_VAR_THRESHOLD = 16  # Foreground threshold of the mog2 model
+KNN_DIST_THRESHOLD = 400.0  # Foreground threshold of the knn model
 INACTIVITY_TIMEOUT = 60  # 1 minute in seconds
 MOTION_CHECK_INTERVAL = 1  # Check for motion every 1 second
 
+# Motion Tracking Configuration
+TRACKER_IOU_THRESHOLD = 0.2  # A motion box overlapping a track this much continues it
+TRACKER_MIN_DISTANCE = 50  # Centroid distance (pixels) that always continues a track
+TRACKER_MAX_SPEED = 800  # Fastest expected movement (pixels/second); widens the distance gate
+TRACKER_MAX_AGE = 1.5  # Seconds without a matching box before a track ends
+TRACKER_HISTORY = 128  # Trajectory points kept per track
+TRACKER_MIN_DISPLACEMENT = 20  # Tracks that moved less (pixels) have no direction
+TRACKER_FINISHED_KEEP = 64  # Ended tracks kept so events can still report them
+
 # Capture Configuration
 TOTAL_CAPTURES = 10  # Total number of images to capture
+PRE_EVENT_CAPTURES = 3  # How many of those come from the pre-event buffer
 CAPTURE_INTERVAL = 1  # Seconds between captures
 IMAGES_TO_SEND = 4  # Number of middle images to send
+EVENT_RECORDING_MODE = "images"  # "images" stores sampled stills, "clip" also records a video clip
+CLIP_CODEC = "MJPG"  # FOURCC of the clip codec (falls back to MJPG if unavailable)
+CLIP_EXTENSION = ".avi"
+CLIP_FPS = 10  # Frame rate of recorded clips
+CLIP_QUALITY = 75  # Encoder quality (0-100) where the codec supports it
+CLIP_QUEUE_SIZE = 64  # Frames waiting for the clip encoder before new ones are dropped
+CLIP_CLOSE_TIMEOUT = 30  # Seconds to wait for the clip encoder when an event ends
+ATTACHMENT_FORMAT = ".jpg"  # Encoding of e-mailed images (".jpg" or ".png")
+ATTACHMENT_JPEG_QUALITY = 90
 
 # Face Detection Configuration
 FACE_DETECTION_ENABLED = True
 MIN_FACE_SIZE = (30, 30)
 FACE_DETECTION_SCALE = 1.1
 FACE_DETECTION_NEIGHBORS = 5
+FACE_MOTION_GATED = True  # Only look for faces inside motion regions
+FACE_DETECTION_STRIDE = 5  # Run the cascade every Nth frame and track faces in between
+FACE_ROI_PADDING = 0.25  # Grow motion regions by this fraction before searching them
+FACE_TRACK_MIN_SCORE = 0.5  # Drop a tracked face when its template match falls below this
+FACE_WORKERS = 0  # Face detection worker processes (0 = detect in the main loop)
+FACE_WORKER_QUEUE_DEPTH = 2  # Frames waiting for a worker before new ones are dropped
+FACE_RESULT_MAX_AGE = 0.5  # Seconds after which a worker result is considered stale
 
 # Monitoring Schedule Configuration
 DEFAULT_START_TIME = "00:00"  # 24-hour format
 DEFAULT_END_TIME = "23:59"
-DAY_SENSITIVITY = 3000
-NIGHT_SENSITIVITY = 2000
+SCHEDULE_WINDOWS = {}  # Weekday ("mon".."sun") -> [("HH:MM", "HH:MM"), ...]; other days use the default hours
+SCHEDULE_HOLIDAYS = {}  # "YYYY-MM-DD" -> windows for that date instead of its weekday's ([] = not monitored)
+SCHEDULE_MAX_RECHECK = 3600  # Re-evaluate the schedule at least this often (seconds)
+# Outside the monitoring windows capture is paused (no frames are decoded or
+# published to the frame bus) unless someone is watching a live stream
+DAY_SENSITIVITY = 3000  # Minimum motion area (pixels) during the day
+NIGHT_SENSITIVITY = 2000  # Minimum motion area (pixels) at night
+DAY_START = "06:00"  # Day sensitivity applies from DAY_START until NIGHT_START
+NIGHT_START = "20:00"
 
 # Image Storage Configuration
 IMAGES_DIR = "images"
 if not os.path.exists(IMAGES_DIR):
     os.makedirs(IMAGES_DIR)
+EVENT_DB_PATH = os.path.join(IMAGES_DIR, "events.db")  # Event index
+EVENT_IMAGE_FORMAT = ".jpg"  # Format of stored event frames (".jpg" or ".png")
+EVENT_JPEG_QUALITY = 90
+EVENT_RETENTION_MAX_BYTES = 2 * 1024 ** 3  # Evict the oldest events above this total size
+EVENT_RETENTION_MAX_AGE_DAYS = 30  # Evict events older than this
+EVENT_WRITE_QUEUE_SIZE = 8  # Events waiting to be written before new ones are dropped
+CLIP_STAGING_DIR = os.path.join(IMAGES_DIR, "clips")  # Clips being recorded
 
 # Email Configuration
 EMAIL_SENDER = os.getenv('EMAIL_SENDER')
 EMAIL_RECEIVER = os.getenv('EMAIL_RECEIVER')
 EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD')
+SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
+SMTP_USE_TLS = os.getenv('SMTP_USE_TLS', '1') != '0'  # Set to 0 for a local test server
+SMTP_TIMEOUT = 30  # Seconds before an SMTP operation is abandoned
+SMTP_POOL_SIZE = 2  # Authenticated SMTP sessions kept open at most
+SMTP_KEEPALIVE_INTERVAL = 60  # Seconds between NOOPs on an idle session
+SMTP_MAX_IDLE = 600  # Close sessions that have been idle this long
+
+# Notification Outbox Configuration
+OUTBOX_PATH = "outbox.db"  # SQLite file holding undelivered notifications
+OUTBOX_WORKERS = 2  # Concurrent delivery workers
+OUTBOX_MAX_ATTEMPTS = 8  # Give up on a notification after this many failures
+OUTBOX_RETRY_BASE_DELAY = 5  # Seconds before the first retry, doubled on every failure
+OUTBOX_RETRY_MAX_DELAY = 900  # Upper bound for the retry delay
 
 # Optional SMS Configuration (Twilio)
 TWILIO_ENABLED = False
@@ -52,5 +150,28 @@ TWILIO_PHONE_TO = os.getenv('TWILIO_PHONE_TO')
 
 # Web Interface Configuration
 WEB_INTERFACE_ENABLED = True
+HEADLESS = os.getenv('HEADLESS', '0') == '1'  # No local preview windows (same as --headless)
 WEB_HOST = "0.0.0.0"
 WEB_PORT = 5000
+STREAM_JPEG_QUALITY = 80  # JPEG quality for the /video_feed stream
+STREAM_MAX_FPS = 15  # Per-client frame rate cap; clients may ask for less with ?fps=
+# Substreams of every camera, picked with /video_feed?stream=<name>:
+# name -> (scale, JPEG quality, max fps); None follows STREAM_JPEG_QUALITY / STREAM_MAX_FPS
+STREAM_RENDITIONS = {
+    "full": (1.0, None, None),
+    "half": (0.5, 70, 10),
+    "thumbnail": (0.25, 60, 2),
+}
+STREAM_DEFAULT_RENDITION = "full"
+SNAPSHOT_MAX_AGE = 1.0  # Seconds an encoded frame is reused for /api/snapshot
+EVENTS_PAGE_SIZE = 50  # Events per /api/events page unless ?limit= asks otherwise
+EVENTS_MAX_PAGE_SIZE = 200
+THUMBNAIL_WIDTH = 320  # Width of event thumbnails (pixels)
+THUMBNAIL_JPEG_QUALITY = 75
+THUMBNAIL_CACHE_SIZE = 256  # Thumbnails kept in memory; the least recently used go first
+
+# Runtime Configuration
+# Settings that can change while running (schedule, sensitivity, rates) start from the
+# values above; changes made through the web interface are versioned and saved here
+RUNTIME_CONFIG_PATH = "runtime_config.json"
+RUNTIME_MAX_FPS = 120  # Highest frame rate the analysis and stream rate settings accept
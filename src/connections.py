@@ -0,0 +1,206 @@
+import time
+import smtplib
+import threading
+import logging
+from email.message import EmailMessage
+from typing import Dict, List, Optional, Tuple
+from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
+from . import config
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+class SMTPConnectionManager:
+    """Keeps a small pool of authenticated SMTP sessions open between alerts.
+
+    Sending reuses an idle session instead of redoing EHLO, STARTTLS and
+    login. Idle sessions are pinged with NOOP every `keepalive` seconds and
+    closed after `max_idle` seconds. A session the server has dropped is
+    replaced transparently and the message is sent again.
+    """
+
+    def __init__(self, username: Optional[str], password: Optional[str],
+                 host: str = config.SMTP_HOST, port: int = config.SMTP_PORT,
+                 use_tls: bool = config.SMTP_USE_TLS, timeout: float = config.SMTP_TIMEOUT,
+                 pool_size: int = config.SMTP_POOL_SIZE,
+                 keepalive: float = config.SMTP_KEEPALIVE_INTERVAL,
+                 max_idle: float = config.SMTP_MAX_IDLE):
+        self.username = username
+        self.password = password
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.pool_size = max(1, pool_size)
+        self.keepalive = keepalive
+        self.max_idle = max_idle
+        self._cond = threading.Condition()
+        self._idle: List[Tuple[smtplib.SMTP, float, float]] = []  # (server, last_used, last_checked)
+        self._open = 0
+        self._keepalive_thread = None
+        self.sends = 0
+        self.reconnects = 0
+        self._reconnects = REGISTRY.counter('smtp_reconnects_total',
+                                            "SMTP sessions re-established after being dropped")
+        self.last_send_ms = 0.0
+        self.average_send_ms = 0.0
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.ehlo()
+            if self.use_tls:
+                server.starttls()
+                server.ehlo()
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            self._close_server(server)
+            raise
+        logger.info(f"Opened SMTP session to {self.host}:{self.port}")
+        return server
+
+    @staticmethod
+    def _close_server(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _acquire(self) -> smtplib.SMTP:
+        """Take an idle session, or open a new one if the pool is not full."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._idle or self._open < self.pool_size)
+            if self._idle:
+                server, _, _ = self._idle.pop()
+                return server
+            self._open += 1
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, server: Optional[smtplib.SMTP]):
+        """Return a session to the pool, or forget a broken one (None)."""
+        with self._cond:
+            if server is None:
+                self._open -= 1
+            else:
+                now = time.monotonic()
+                self._idle.append((server, now, now))
+                self._start_keepalive()
+            self._cond.notify()
+
+    def send_message(self, message: EmailMessage):
+        """Send a message over a pooled session, reconnecting once if it was dropped."""
+        start = time.perf_counter()
+        for attempt in range(2):
+            server = self._acquire()
+            try:
+                server.send_message(message)
+            except (smtplib.SMTPServerDisconnected, ConnectionError, OSError) as e:
+                self._close_server(server)
+                self._release(None)
+                if attempt == 1:
+                    raise
+                self.reconnects += 1
+                self._reconnects.inc()
+                logger.warning(f"SMTP session dropped ({str(e)}), reconnecting")
+                continue
+            except Exception:
+                self._close_server(server)
+                self._release(None)
+                raise
+            self._release(server)
+            break
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.sends += 1
+        self.last_send_ms = elapsed_ms
+        self.average_send_ms += (elapsed_ms - self.average_send_ms) / min(self.sends, 100)
+        logger.info(f"Email sent in {elapsed_ms:.0f} ms")
+
+    def latency_summary(self) -> Dict[str, float]:
+        """Per-send latency figures."""
+        return {
+            'sends': self.sends,
+            'reconnects': self.reconnects,
+            'last_ms': round(self.last_send_ms, 1),
+            'average_ms': round(self.average_send_ms, 1),
+        }
+
+    def _start_keepalive(self):
+        if self._keepalive_thread is None or not self._keepalive_thread.is_alive():
+            self._keepalive_thread = threading.Thread(target=self._keepalive_loop, name="SMTPKeepalive")
+            self._keepalive_thread.daemon = True
+            self._keepalive_thread.start()
+
+    def _keepalive_loop(self):
+        """NOOP idle sessions to keep them alive, and close the ones idle too long."""
+        while True:
+            time.sleep(min(self.keepalive, 5))
+            now = time.monotonic()
+            with self._cond:
+                if not self._idle:
+                    self._keepalive_thread = None
+                    return
+                due = [entry for entry in self._idle
+                       if now - entry[1] >= self.max_idle or now - entry[2] >= self.keepalive]
+                for entry in due:
+                    self._idle.remove(entry)
+
+            for server, last_used, _ in due:
+                alive = False
+                if now - last_used < self.max_idle:
+                    try:
+                        alive = server.noop()[0] == 250
+                    except Exception:
+                        alive = False
+                if alive:
+                    with self._cond:
+                        self._idle.append((server, last_used, time.monotonic()))
+                        self._cond.notify()
+                else:
+                    self._close_server(server)
+                    self._release(None)
+
+    def close(self):
+        """Close every idle session."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for server, _, _ in idle:
+            self._close_server(server)
+
+_smtp_managers: Dict[Tuple[str, int, Optional[str]], SMTPConnectionManager] = {}
+_twilio_client = None
+_lock = threading.Lock()
+
+def get_smtp_manager(username: Optional[str], password: Optional[str]) -> SMTPConnectionManager:
+    """Return the shared SMTP session pool for these credentials."""
+    key = (config.SMTP_HOST, config.SMTP_PORT, username)
+    with _lock:
+        if key not in _smtp_managers:
+            _smtp_managers[key] = SMTPConnectionManager(username, password)
+        return _smtp_managers[key]
+
+def get_twilio_client():
+    """Return the shared Twilio client, or None if SMS is not configured.
+
+    A single client is reused so its HTTP session (and TLS connection) is
+    kept alive between alerts.
+    """
+    global _twilio_client
+    if not (config.TWILIO_ENABLED and config.TWILIO_ACCOUNT_SID and config.TWILIO_AUTH_TOKEN):
+        return None
+    with _lock:
+        if _twilio_client is None:
+            _twilio_client = Client(
+                config.TWILIO_ACCOUNT_SID, config.TWILIO_AUTH_TOKEN,
+                http_client=TwilioHttpClient(pool_connections=True)
+            )
+        return _twilio_client
@@ -0,0 +1,79 @@
+import cv2
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+Box = Tuple[int, int, int, int]
+
+# Detection labels
+MOTION = 0
+FACE = 1
+LABEL_NAMES = ('motion', 'face')
+# BGR colour and line thickness each label is drawn with
+STYLES = {MOTION: ((0, 255, 0), 3), FACE: ((255, 0, 0), 2)}
+
+_NO_BOXES = np.zeros((0, 4), np.int32)
+_NO_VALUES = np.zeros(0, np.float32)
+_NO_LABELS = np.zeros(0, np.uint8)
+
+class DetectionResult:
+    """Everything detected in one frame, kept apart from the frame's pixels.
+
+    Boxes (x, y, w, h), labels and scores are parallel arrays, so a result
+    costs a few small allocations instead of a copy of the frame. Boxes
+    are only drawn when an output asks for them with `render`.
+    """
+
+    __slots__ = ('seq', 'timestamp', 'boxes', 'labels', 'scores', 'motion_detected', 'should_capture')
+
+    def __init__(self, seq: int = 0, timestamp: float = 0.0,
+                 motion_detected: bool = False, should_capture: bool = False):
+        self.seq = seq
+        self.timestamp = timestamp  # time.monotonic() when the frame was captured
+        self.boxes = _NO_BOXES
+        self.labels = _NO_LABELS
+        self.scores = _NO_VALUES
+        self.motion_detected = motion_detected
+        self.should_capture = should_capture
+
+    def add(self, boxes: Sequence[Box], label: int, scores: Optional[Sequence[float]] = None):
+        """Append boxes of one label (scores default to 1)."""
+        if not len(boxes):
+            return
+        boxes = np.asarray(boxes, np.int32).reshape(-1, 4)
+        scores = np.ones(len(boxes), np.float32) if scores is None else np.asarray(scores, np.float32)
+        self.boxes = np.concatenate([self.boxes, boxes])
+        self.labels = np.concatenate([self.labels, np.full(len(boxes), label, np.uint8)])
+        self.scores = np.concatenate([self.scores, scores])
+
+    def boxes_of(self, label: int) -> List[Box]:
+        return [tuple(box) for box in self.boxes[self.labels == label].tolist()]
+
+    @property
+    def motion_boxes(self) -> List[Box]:
+        return self.boxes_of(MOTION)
+
+    @property
+    def face_locations(self) -> List[Box]:
+        return self.boxes_of(FACE)
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def render(self, frame: np.ndarray) -> np.ndarray:
+        """Copy of `frame` with the boxes drawn on it; the frame itself stays clean."""
+        rendered = frame.copy()
+        for (x, y, w, h), label in zip(self.boxes.tolist(), self.labels.tolist()):
+            color, thickness = STYLES[label]
+            cv2.rectangle(rendered, (x, y), (x + w, y + h), color, thickness)
+        return rendered
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly form, as stored next to the clean event frames."""
+        return {
+            'seq': self.seq,
+            'motion_detected': self.motion_detected,
+            'detections': [
+                {'label': LABEL_NAMES[label], 'box': box, 'score': round(score, 4)}
+                for box, label, score in zip(self.boxes.tolist(), self.labels.tolist(), self.scores.tolist())
+            ],
+        }
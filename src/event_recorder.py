@@ -0,0 +1,202 @@
+import os
+import time
+from datetime import datetime
+import threading
+import logging
+from collections import deque
+from typing import Callable, List, NamedTuple, Optional, Tuple
+import numpy as np
+from . import config
+from .clip_writer import ClipWriter
+from .detection import DetectionResult
+from .tracker import MotionTracker, TrackSummary
+
+logger = logging.getLogger(__name__)
+
+class CapturedFrame(NamedTuple):
+    """A clean frame sampled for an event together with what was detected in it."""
+    timestamp: float
+    frame: np.ndarray
+    detections: Optional[DetectionResult] = None
+
+    @property
+    def face_locations(self) -> List[Tuple[int, int, int, int]]:
+        return self.detections.face_locations if self.detections is not None else []
+
+    def render(self) -> np.ndarray:
+        """A copy of the frame with its detections drawn on it."""
+        if self.detections is None:
+            return self.frame.copy()
+        return self.detections.render(self.frame)
+
+class DetectionEvent:
+    """Frames and details of a single detection event."""
+
+    def __init__(self, event_id: int, trigger_time: float, camera: str = "camera0",
+                 motion_score: float = 0.0):
+        self.event_id = event_id
+        self.trigger_time = trigger_time
+        self.camera = camera
+        self.motion_score = motion_score
+        self.frames: List[CapturedFrame] = []
+        self.face_detected = False
+        self.tracks: List[TrackSummary] = []  # Objects tracked during the event, longest path first
+        self.motion_direction: Optional[str] = None
+        self.motion_speed: Optional[float] = None  # Pixels per second of the main moving object
+        self.dwell_time: Optional[float] = None  # Seconds the longest-staying object was in view
+        self.clip_path: Optional[str] = None
+
+    def frames_to_send(self, count: int = config.IMAGES_TO_SEND) -> List[CapturedFrame]:
+        """Select the middle `count` frames of the event."""
+        start_idx = max(0, (len(self.frames) - count) // 2)
+        return self.frames[start_idx:start_idx + count]
+
+def wall_clock(timestamp: float) -> datetime:
+    """Convert a time.monotonic() timestamp to local wall-clock time."""
+    return datetime.fromtimestamp(time.time() - (time.monotonic() - timestamp))
+
+class EventRecorder:
+    """Records detection events without ever blocking the main loop.
+
+    Frames are sampled every `interval` seconds into an in-memory pre-roll
+    buffer. When an event is triggered the pre-roll becomes the start of the
+    event and post-event frames keep being sampled on the same schedule while
+    the caller carries on. Once the event is complete it is summarized and
+    handed to `on_event` on a background thread.
+
+    With `clip_dir` set, frames are also sampled at `clip_fps` (with their
+    own pre-roll) and encoded into a video clip by a ClipWriter while the
+    event runs. The sampled stills then serve as keyframes.
+
+    With a `tracker` (updated by the caller on every frame) the objects it
+    followed during the event give the event's direction, speed and dwell
+    time.
+    """
+
+    def __init__(self, on_event: Callable[[DetectionEvent], None],
+                 pre_event: int = config.PRE_EVENT_CAPTURES,
+                 total: int = config.TOTAL_CAPTURES,
+                 interval: float = config.CAPTURE_INTERVAL,
+                 camera: str = "camera0",
+                 clip_dir: Optional[str] = None,
+                 clip_fps: float = config.CLIP_FPS,
+                 tracker: Optional[MotionTracker] = None):
+        self.on_event = on_event
+        self.tracker = tracker
+        self.total = total
+        self.interval = interval
+        self.camera = camera
+        self.clip_dir = clip_dir
+        self.clip_fps = clip_fps
+        self._clip_interval = 1.0 / clip_fps
+        self._clip_preroll = deque(maxlen=max(1, int(pre_event * interval * clip_fps)))
+        self._clip: Optional[ClipWriter] = None
+        self._clip_failed = False
+        self._last_clip_frame = 0.0
+        if clip_dir is not None:
+            os.makedirs(clip_dir, exist_ok=True)
+        self._preroll = deque(maxlen=max(1, min(pre_event, total - 1)))
+        self._preroll_enabled = pre_event > 0
+        self._last_sample = 0.0
+        self._active: Optional[DetectionEvent] = None
+        self._next_capture = 0.0
+        self._event_count = 0
+
+    @property
+    def recording(self) -> bool:
+        """Whether an event is currently collecting post-event frames."""
+        return self._active is not None
+
+    def trigger(self, timestamp: Optional[float] = None, motion_score: float = 0.0) -> bool:
+        """Start a new event. Returns False if one is already being recorded."""
+        if self._active is not None:
+            return False
+        now = timestamp if timestamp is not None else time.monotonic()
+        self._event_count += 1
+        event = DetectionEvent(self._event_count, now, self.camera, motion_score)
+        event.frames.extend(self._preroll)
+        self._preroll.clear()
+        self._active = event
+        self._clip_failed = False
+        self._next_capture = now
+        logger.info(f"Event {event.event_id} started with {len(event.frames)} pre-event frames")
+        return True
+
+    def feed(self, frame: np.ndarray, detections: Optional[DetectionResult] = None,
+             timestamp: Optional[float] = None):
+        """Offer the current frame; it is only kept when a sample is due.
+
+        The frame is kept as it is, without a copy, so the caller must not
+        draw on it afterwards; `detections` are kept alongside it.
+        """
+        now = timestamp if timestamp is not None else time.monotonic()
+        if self.clip_dir is not None:
+            self._feed_clip(frame, now)
+
+        if self._active is not None:
+            if now < self._next_capture:
+                return
+            self._active.frames.append(CapturedFrame(now, frame, detections))
+            self._next_capture = now + self.interval
+            if len(self._active.frames) >= self.total:
+                event, self._active = self._active, None
+                if self.tracker is not None:
+                    # Summaries are immutable, so the finalizer thread can use them freely
+                    event.tracks = self.tracker.summaries(since=event.frames[0].timestamp)
+                clip, self._clip = self._clip, None
+                self._last_sample = now
+                thread = threading.Thread(target=self._finalize, args=(event, clip))
+                thread.daemon = True
+                thread.start()
+            return
+
+        if self._preroll_enabled and now - self._last_sample >= self.interval:
+            self._preroll.append(CapturedFrame(now, frame, detections))
+            self._last_sample = now
+
+    def _feed_clip(self, frame: np.ndarray, now: float):
+        """Sample a frame for the event clip, or for the clip pre-roll."""
+        if now - self._last_clip_frame < self._clip_interval:
+            return
+        self._last_clip_frame = now
+
+        if self._active is None:
+            self._clip_preroll.append(frame)
+            return
+
+        if self._clip_failed:
+            return
+        if self._clip is None:
+            path = os.path.join(
+                self.clip_dir,
+                f"{self.camera}_{int(time.time())}_{self._active.event_id}{config.CLIP_EXTENSION}"
+            )
+            try:
+                self._clip = ClipWriter(path, self.clip_fps, (frame.shape[1], frame.shape[0]))
+            except IOError as e:
+                logger.error(f"Clip recording disabled for this event: {str(e)}")
+                self._clip_failed = True
+                self._clip_preroll.clear()
+                return
+            for preroll_frame in self._clip_preroll:
+                self._clip.write(preroll_frame)
+            self._clip_preroll.clear()
+        self._clip.write(frame)
+
+    def _finalize(self, event: DetectionEvent, clip: Optional[ClipWriter] = None):
+        """Summarize the event and hand it to the callback."""
+        try:
+            if clip is not None:
+                event.clip_path = clip.close()
+            event.face_detected = any(captured.face_locations for captured in event.frames)
+            if event.tracks:
+                # The object that moved furthest describes the event
+                moving = [track for track in event.tracks if track.direction is not None]
+                main_track = moving[0] if moving else event.tracks[0]
+                event.motion_direction = main_track.direction
+                event.motion_speed = main_track.speed
+                event.dwell_time = max(track.dwell_time for track in event.tracks)
+            logger.info(f"Event {event.event_id} finalized with {len(event.frames)} frames")
+            self.on_event(event)
+        except Exception as e:
+            logger.error(f"Failed to finalize event {event.event_id}: {str(e)}")
@@ -0,0 +1,236 @@
+import cv2
+import os
+import json
+import time
+import queue
+import shutil
+import sqlite3
+import threading
+import logging
+from typing import Any, Dict, List, Optional
+from . import config
+from .event_recorder import DetectionEvent, wall_clock
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    camera TEXT NOT NULL,
+    face_detected INTEGER NOT NULL,
+    direction TEXT,
+    speed REAL,
+    dwell REAL,
+    tracks INTEGER,
+    motion_score REAL NOT NULL,
+    frame_count INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    clip TEXT
+);
+CREATE INDEX IF NOT EXISTS events_started_at ON events (started_at);
+"""
+
+DETECTIONS_FILE = "detections.json"  # Per-frame detection boxes and track summaries of an event
+
+class EventStore:
+    """Keeps detection events on disk with their metadata indexed in SQLite.
+
+    Every event gets its own directory under `root` holding its frames, or
+    its video clip plus the keyframe stills when it was recorded as a clip.
+    Frames are stored clean; what was detected in them (and the tracked
+    objects) goes next to them in `detections.json`.
+    Events are written by a background thread, so `save` never blocks the
+    caller. After each write the oldest events are evicted until the store
+    is under `max_bytes` and nothing is older than `max_age` seconds. The
+    running total comes from the index, so the directory is never scanned.
+    """
+
+    def __init__(self, root: str = config.IMAGES_DIR,
+                 db_path: str = config.EVENT_DB_PATH,
+                 max_bytes: int = config.EVENT_RETENTION_MAX_BYTES,
+                 max_age: float = config.EVENT_RETENTION_MAX_AGE_DAYS * 86400,
+                 queue_size: int = config.EVENT_WRITE_QUEUE_SIZE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(events)")]
+        for column, kind in (('clip', 'TEXT'), ('speed', 'REAL'), ('dwell', 'REAL'), ('tracks', 'INTEGER')):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE events ADD COLUMN {column} {kind}")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM events").fetchone()[0]
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._dropped = REGISTRY.counter('event_store_dropped_total', "Events dropped because the writer was behind")
+        REGISTRY.gauge('queue_depth', "Items waiting in an internal queue",
+                       func=self._queue.qsize, queue='event_store')
+        REGISTRY.gauge('event_store_bytes', "Bytes used by stored events", func=lambda: self._total_bytes)
+        self._thread = threading.Thread(target=self._run, name="EventStoreWriter")
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def save(self, event: DetectionEvent) -> bool:
+        """Queue an event for writing. Returns False if the writer is backed up."""
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self._dropped.inc()
+            logger.error(f"Event store queue full, dropping event {event.event_id}")
+            return False
+
+    def close(self, timeout: float = 10.0):
+        """Finish pending writes and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                break
+            try:
+                self._write(event)
+                self._enforce_retention()
+            except Exception as e:
+                logger.error(f"Failed to store event {event.event_id}: {str(e)}")
+
+    def _write(self, event: DetectionEvent):
+        """Write the event frames (or clip and keyframes) and index the event."""
+        started_at = wall_clock(event.trigger_time).timestamp()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO events (started_at, camera, face_detected, direction, speed, dwell, tracks, "
+                "motion_score, frame_count, bytes, path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, 0, '')",
+                (started_at, event.camera, int(event.face_detected), event.motion_direction,
+                 event.motion_speed, event.dwell_time, len(event.tracks), event.motion_score)
+            )
+            self._conn.commit()
+        event_id = cursor.lastrowid
+
+        event_dir = os.path.join(self.root, str(event_id))
+        try:
+            os.makedirs(event_dir, exist_ok=True)
+            params = []
+            if config.EVENT_IMAGE_FORMAT == '.jpg':
+                params = [cv2.IMWRITE_JPEG_QUALITY, config.EVENT_JPEG_QUALITY]
+            total = 0
+            clip = None
+            frames = event.frames
+            if event.clip_path is not None:
+                clip = os.path.join(event_dir, f"clip{os.path.splitext(event.clip_path)[1]}")
+                os.replace(event.clip_path, clip)
+                total += os.path.getsize(clip)
+                frames = event.frames_to_send()
+
+            annotations = []
+            for i, captured in enumerate(frames, 1):
+                ret, buffer = cv2.imencode(config.EVENT_IMAGE_FORMAT, captured.frame, params)
+                if not ret:
+                    continue
+                with open(os.path.join(event_dir, f"{i}{config.EVENT_IMAGE_FORMAT}"), 'wb') as f:
+                    f.write(buffer)
+                total += len(buffer)
+                annotation = {'frame': i, 'time': wall_clock(captured.timestamp).timestamp()}
+                if captured.detections is not None:
+                    annotation.update(captured.detections.to_dict())
+                annotations.append(annotation)
+
+            metadata = json.dumps({
+                'frames': annotations,
+                'tracks': [summary._asdict() for summary in event.tracks],
+            }).encode()
+            with open(os.path.join(event_dir, DETECTIONS_FILE), 'wb') as f:
+                f.write(metadata)
+            total += len(metadata)
+
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE events SET frame_count = ?, bytes = ?, path = ?, clip = ? WHERE id = ?",
+                    (len(frames), total, event_dir, clip, event_id)
+                )
+                self._conn.commit()
+                self._total_bytes += total
+        except Exception:
+            # Don't leave a placeholder row or half-written directory behind
+            with self._lock:
+                self._conn.execute("DELETE FROM events WHERE id = ?", (event_id,))
+                self._conn.commit()
+            shutil.rmtree(event_dir, ignore_errors=True)
+            raise
+        logger.info(f"Stored event {event_id} ({len(frames)} frames{', clip' if clip else ''}, "
+                    f"{total / 1024:.0f} KB)")
+
+    def _enforce_retention(self):
+        """Evict the oldest events until the store is within its size and age limits."""
+        cutoff = time.time() - self.max_age
+        while True:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT id, started_at, bytes, path FROM events ORDER BY started_at LIMIT 1"
+                ).fetchone()
+                if row is None or (self._total_bytes <= self.max_bytes and row[1] >= cutoff):
+                    return
+                event_id, _, size, path = row
+                self._conn.execute("DELETE FROM events WHERE id = ?", (event_id,))
+                self._conn.commit()
+                self._total_bytes -= size
+            if path:
+                shutil.rmtree(path, ignore_errors=True)
+            logger.info(f"Evicted event {event_id} ({size / 1024:.0f} KB)")
+
+    def list_events(self, limit: int = 50, offset: int = 0, before: Optional[float] = None,
+                    camera: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return stored events, newest first.
+
+        `before` (a Unix time) pages by start time along the started_at
+        index, which stays stable while new events arrive; `camera`
+        restricts the list to one camera.
+        """
+        where, params = ["frame_count > 0"], []
+        if before is not None:
+            where.append("started_at < ?")
+            params.append(before)
+        if camera is not None:
+            where.append("camera = ?")
+            params.append(camera)
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT id, started_at, camera, face_detected, direction, speed, dwell, tracks, motion_score, "
+                f"frame_count, bytes, clip IS NOT NULL AS has_clip FROM events WHERE {' AND '.join(where)} "
+                "ORDER BY started_at DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            )
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def get_event(self, event_id: int) -> Optional[Dict[str, Any]]:
+        """Return one event's metadata, including its directory."""
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM events WHERE id = ?", (event_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([c[0] for c in cursor.description], row))
+
+    def detections(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Detection metadata of a stored event, or None if it has none."""
+        try:
+            with open(os.path.join(event['path'], DETECTIONS_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def frame_path(self, event: Dict[str, Any], index: int) -> str:
+        """Path of the `index`-th (1-based) frame of a stored event."""
+        return os.path.join(event['path'], f"{index}{config.EVENT_IMAGE_FORMAT}")
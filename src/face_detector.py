@@ -1,38 +1,239 @@
 import cv2
 import numpy as np
 import logging
-from typing import List, Tuple
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from . import config
+from .metrics import REGISTRY
 
 logger = logging.getLogger(__name__)
 
+Box = Tuple[int, int, int, int]
+
+def pad_box(box: Box, padding: float, frame_shape: Tuple[int, ...]) -> Box:
+    """Grow a box by `padding` times its size on every side, clipped to the frame."""
+    x, y, w, h = box
+    height, width = frame_shape[:2]
+    pad_x, pad_y = int(w * padding), int(h * padding)
+    x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+    x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+    return x0, y0, x1 - x0, y1 - y0
+
+def merge_boxes(boxes: List[Box]) -> List[Box]:
+    """Merge overlapping boxes until none of them overlap."""
+    merged = list(boxes)
+    changed = True
+    while changed:
+        changed = False
+        result = []
+        while merged:
+            x, y, w, h = merged.pop()
+            i = 0
+            while i < len(merged):
+                ox, oy, ow, oh = merged[i]
+                if x < ox + ow and ox < x + w and y < oy + oh and oy < y + h:
+                    x0, y0 = min(x, ox), min(y, oy)
+                    x1, y1 = max(x + w, ox + ow), max(y + h, oy + oh)
+                    x, y, w, h = x0, y0, x1 - x0, y1 - y0
+                    merged.pop(i)
+                    changed = True
+                else:
+                    i += 1
+            result.append((x, y, w, h))
+        merged = result
+    return merged
+
+class FaceTracker:
+    """Carries face boxes forward between detections with template matching.
+
+    Each face keeps a small grayscale template. On frames without a cascade
+    pass the template is searched for in a window around its last position;
+    faces whose match score drops below `min_score` are dropped.
+    """
+
+    def __init__(self, min_score: float = config.FACE_TRACK_MIN_SCORE, search_margin: float = 0.5):
+        self.min_score = min_score
+        self.search_margin = search_margin
+        self._tracks: List[Tuple[Box, np.ndarray]] = []
+
+    @property
+    def boxes(self) -> List[Box]:
+        return [box for box, _ in self._tracks]
+
+    def reset(self, frame: np.ndarray, boxes: List[Box]):
+        """Start tracking a fresh set of detected faces."""
+        self._tracks = []
+        for (x, y, w, h) in boxes:
+            template = cv2.cvtColor(frame[y:y + h, x:x + w], cv2.COLOR_BGR2GRAY)
+            self._tracks.append(((x, y, w, h), template))
+
+    def update(self, frame: np.ndarray, frames_elapsed: int = 1) -> List[Box]:
+        """Find every tracked face in the new frame and return the updated boxes.
+
+        `frames_elapsed` widens the search window when the templates come
+        from a frame several frames back.
+        """
+        margin = self.search_margin * min(max(1, frames_elapsed), 4)
+        tracks = []
+        for box, template in self._tracks:
+            sx, sy, sw, sh = pad_box(box, margin, frame.shape)
+            _, _, w, h = box
+            if sw < w or sh < h:
+                continue
+            window = cv2.cvtColor(frame[sy:sy + sh, sx:sx + sw], cv2.COLOR_BGR2GRAY)
+            scores = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (mx, my) = cv2.minMaxLoc(scores)
+            if score < self.min_score:
+                continue
+            tracks.append(((sx + mx, sy + my, w, h), template))
+        self._tracks = tracks
+        return self.boxes
+
 class FaceDetector:
-    def __init__(self):
+    def __init__(self, stride: int = config.FACE_DETECTION_STRIDE,
+                 roi_padding: float = config.FACE_ROI_PADDING, pool=None, channel: str = "default",
+                 frame_bus: Optional[Tuple[str, int]] = None):
         # Load the pre-trained face cascade
         self.face_cascade = cv2.CascadeClassifier(
             cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
         )
-        
-    def detect_faces(self, frame: np.ndarray) -> Tuple[List[Tuple[int, int, int, int]], np.ndarray]:
+        self.stride = max(1, stride)
+        self.roi_padding = roi_padding
+        self.tracker = FaceTracker()
+        self._frames_since_detection = self.stride
+        # Optional FaceDetectionPool; detection then runs asynchronously in worker processes
+        self.pool = pool
+        self.channel = channel
+        # (segment name, consumer id) of a frame bus the pool workers read frames from
+        self.frame_bus = frame_bus
+        self._frame_seq = None
+        self._seq = 0
+        self._applied_seq = 0
+        # Frames handed to the pool by detector seq, to seed tracking templates from
+        # the frame a result was computed on rather than the frame it arrives with
+        self._submitted: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._detect_time = REGISTRY.histogram(
+            'pipeline_stage_seconds', "Time spent in each pipeline stage", camera=channel, stage='faces'
+        )
+        self._cascade_time = REGISTRY.histogram(
+            'pipeline_stage_seconds', "Time spent in each pipeline stage", camera=channel, stage='face_cascade'
+        )
+
+    def locate_faces(self, frame: np.ndarray, rois: Optional[List[Box]] = None) -> List[Box]:
+        """Run the cascade on the whole frame, or only inside `rois`.
+        Returns face coordinates (x, y, w, h) in full-frame coordinates.
         """
-        Detect faces in the frame and return their locations.
-        Returns:
-            - List of face coordinates (x, y, w, h)
-            - Frame with face rectangles drawn
+        if rois is None:
+            rois = [(0, 0, frame.shape[1], frame.shape[0])]
+
+        min_w, min_h = config.MIN_FACE_SIZE
+        face_locations = []
+        for (rx, ry, rw, rh) in rois:
+            if rw < min_w or rh < min_h:
+                continue
+            gray = cv2.cvtColor(frame[ry:ry + rh, rx:rx + rw], cv2.COLOR_BGR2GRAY)
+            faces = self.face_cascade.detectMultiScale(
+                gray,
+                scaleFactor=config.FACE_DETECTION_SCALE,
+                minNeighbors=config.FACE_DETECTION_NEIGHBORS,
+                minSize=config.MIN_FACE_SIZE
+            )
+            for (x, y, w, h) in faces:
+                face_locations.append((int(rx + x), int(ry + y), int(w), int(h)))
+        return face_locations
+
+    def _run_detection(self, frame: np.ndarray, rois: Optional[List[Box]]) -> Optional[List[Box]]:
+        """Detect now, or hand the frame to the worker pool.
+        Returns None when the pool has no new result yet.
         """
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(30, 30)
-        )
+        if self.pool is None:
+            with self._cascade_time.time():
+                return self.locate_faces(frame, rois)
+        frame_ref = None
+        if self.frame_bus is not None and self._frame_seq is not None:
+            frame_ref = self.frame_bus + (self._frame_seq,)
+        if self.pool.submit(self._seq, frame, rois, channel=self.channel, frame_ref=frame_ref):
+            # Frames are never drawn on, so keeping a reference is enough
+            self._submitted[self._seq] = frame
+            while len(self._submitted) > self.pool.queue_depth + self.pool.workers:
+                self._submitted.popitem(last=False)
+        return self._pool_result(frame)
         
-        frame_with_faces = frame.copy()
-        face_locations = []
+    def _pool_result(self, frame: np.ndarray) -> Optional[List[Box]]:
+        """Faces of the newest pool result not applied yet, moved to `frame`, or None.
+
+        The result belongs to an earlier frame. Its faces are cut from that
+        frame as tracking templates and then searched for in `frame`, so a
+        moving subject is not looked for at its old position.
+        """
+        result = self.pool.latest(self.channel)
+        if result is None or result.seq <= self._applied_seq:
+            return None
+        self._applied_seq = result.seq
+        source = self._submitted.pop(result.seq, None)
+        for seq in [seq for seq in self._submitted if seq < result.seq]:
+            del self._submitted[seq]
+        if source is None:
+            return None
+        self.tracker.reset(source, result.face_locations)
+        if source is frame:
+            return result.face_locations
+        return self.tracker.update(frame, frames_elapsed=self._seq - result.seq)
         
-        for (x, y, w, h) in faces:
-            # Draw rectangle around face
-            cv2.rectangle(frame_with_faces, (x, y), (x+w, y+h), (255, 0, 0), 2)
-            face_locations.append((x, y, w, h))
-            
-        return face_locations, frame_with_faces
+    def _gated_locations(self, frame: np.ndarray, motion_boxes: List[Box]) -> List[Box]:
+        """Detect inside motion regions every `stride` frames and track in between."""
+        tracked = self.tracker.boxes
+        if not motion_boxes and not tracked:
+            # Quiet scene: nothing to look at, detect as soon as something moves
+            self._frames_since_detection = self.stride
+            return []
+
+        face_locations = None
+        if self._frames_since_detection < self.stride:
+            self._frames_since_detection += 1
+            if self.pool is not None:
+                face_locations = self._pool_result(frame)
+        else:
+            self._frames_since_detection = 1
+            rois = merge_boxes([pad_box(box, self.roi_padding, frame.shape)
+                                for box in list(motion_boxes) + tracked])
+            face_locations = self._run_detection(frame, rois)
+
+        if face_locations is None:
+            return self.tracker.update(frame)
+        self.tracker.reset(frame, face_locations)
+        return face_locations
+
+    def detect_faces(self, frame: np.ndarray,
+                     motion_boxes: Optional[List[Box]] = None,
+                     gated: Optional[bool] = None,
+                     frame_seq: Optional[int] = None) -> List[Box]:
+        """
+        Detect faces in the frame and return their locations (x, y, w, h).
+        When `motion_boxes` is given and gating is on (`gated`, defaulting
+        to FACE_MOTION_GATED), the cascade
+        only runs inside the padded motion regions every `stride` frames.
+        With a worker pool the most recent completed result is used instead
+        of waiting for this frame's detection; `frame_seq` (the capture
+        sequence number) lets the workers read the frame from the frame bus.
+        The frame is not drawn on.
+        """
+        self._frame_seq = frame_seq
+        with self._detect_time.time():
+            return self._detect_faces(frame, motion_boxes,
+                                      config.FACE_MOTION_GATED if gated is None else gated)
+
+    def _detect_faces(self, frame: np.ndarray, motion_boxes: Optional[List[Box]],
+                      gated: bool) -> List[Box]:
+        self._seq += 1
+        if motion_boxes is not None and gated:
+            face_locations = self._gated_locations(frame, motion_boxes)
+        elif self.pool is not None:
+            face_locations = self._run_detection(frame, None)
+            if face_locations is None:
+                # Follow the last result's faces until the next one arrives
+                face_locations = self.tracker.update(frame)
+        else:
+            with self._cascade_time.time():
+                face_locations = self.locate_faces(frame)
+        return face_locations
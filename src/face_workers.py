@@ -0,0 +1,165 @@
+import time
+import queue
+import threading
+import logging
+import multiprocessing
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+from . import config
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+Box = Tuple[int, int, int, int]
+
+class FaceResult(NamedTuple):
+    """Faces found by a worker for one submitted frame."""
+    channel: str  # Which submitter (camera) the frame came from
+    seq: int
+    timestamp: float  # time.monotonic() when the frame was submitted
+    face_locations: Optional[List[Box]]  # None if the frame left the frame bus before it was searched
+
+# (frame bus segment name, consumer id, frame sequence number)
+FrameRef = Tuple[str, int, int]
+
+def _worker_main(tasks, results):
+    """Worker process: run the cascade on submitted regions until told to stop.
+
+    A task carries either the pixel crops themselves, or a reference to a
+    frame on a shared-memory frame bus plus the regions to search in it.
+    """
+    from .face_detector import FaceDetector
+    from .frame_bus import FrameBusReader
+    detector = FaceDetector()
+    readers: Dict[Tuple[str, int], FrameBusReader] = {}
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            channel, seq, timestamp, regions, frame_ref = task
+            face_locations = []
+            try:
+                if frame_ref is None:
+                    for (ox, oy), crop in regions:
+                        for (x, y, w, h) in detector.locate_faces(crop):
+                            face_locations.append((ox + x, oy + y, w, h))
+                else:
+                    bus_name, consumer_id, frame_seq = frame_ref
+                    reader = readers.get((bus_name, consumer_id))
+                    if reader is None:
+                        reader = readers[(bus_name, consumer_id)] = FrameBusReader(bus_name, consumer_id)
+                    # Search the shared slot in place; None if it was reused before or during the search
+                    item = reader.read(frame_seq)
+                    if item is not None:
+                        face_locations = detector.locate_faces(item.frame, regions)
+                        if not reader.is_current(item):
+                            face_locations = None
+                    else:
+                        face_locations = None
+            except Exception as e:
+                logger.error(f"Face worker failed on frame {seq}: {str(e)}")
+            results.put((channel, seq, timestamp, face_locations))
+    finally:
+        for reader in readers.values():
+            reader.close()
+
+class FaceDetectionPool:
+    """Runs Haar cascade detection in separate processes.
+
+    Frames (or just their regions of interest) are submitted without
+    waiting, tagged with a sequence number; frames on a shared-memory
+    frame bus are passed by reference. When every worker is busy and
+    the task queue is full the frame is dropped rather than queued. Callers
+    poll `latest()` for the most recent completed result of their channel;
+    results older than one already seen, or older than `max_age` seconds,
+    are discarded. Several cameras can share one pool through channels.
+    """
+
+    def __init__(self, workers: int = config.FACE_WORKERS,
+                 queue_depth: int = config.FACE_WORKER_QUEUE_DEPTH,
+                 max_age: float = config.FACE_RESULT_MAX_AGE):
+        self.workers = max(1, workers)
+        self.queue_depth = max(1, queue_depth)
+        self.max_age = max_age
+        # Spawn so workers never inherit the capture and web threads
+        self._context = multiprocessing.get_context('spawn')
+        self._tasks = self._context.Queue(maxsize=self.queue_depth)
+        self._results = self._context.Queue()
+        self._processes = []
+        self._latest: Dict[str, FaceResult] = {}
+        self._lock = threading.Lock()
+        self._submitted = REGISTRY.counter('face_pool_submitted_total', "Frames handed to the face workers")
+        self._dropped = REGISTRY.counter('face_pool_dropped_total',
+                                         "Frames dropped because every face worker was busy")
+        self._stale = REGISTRY.counter('face_pool_stale_total', "Face results discarded as out of date")
+        REGISTRY.gauge('queue_depth', "Items waiting in an internal queue",
+                       func=self._tasks.qsize, queue='face_tasks')
+
+    def start(self):
+        """Start the worker processes."""
+        for i in range(self.workers):
+            process = self._context.Process(
+                target=_worker_main, args=(self._tasks, self._results), name=f"FaceWorker-{i}"
+            )
+            process.daemon = True
+            process.start()
+            self._processes.append(process)
+        logger.info(f"Started {self.workers} face detection workers")
+
+    def stop(self, timeout: float = 2.0):
+        """Stop the worker processes."""
+        for _ in self._processes:
+            try:
+                self._tasks.put_nowait(None)
+            except queue.Full:
+                break
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+
+    def submit(self, seq: int, frame: np.ndarray, rois: Optional[List[Box]] = None,
+               channel: str = "default", frame_ref: Optional[FrameRef] = None) -> bool:
+        """Queue a frame, or only its `rois`, for detection.
+
+        With a `frame_ref` the workers read the frame from the frame bus
+        and only the region coordinates are sent. Returns False if the
+        frame was dropped because the queue is full.
+        """
+        if rois is None:
+            rois = [(0, 0, frame.shape[1], frame.shape[0])]
+        if frame_ref is not None:
+            regions = list(rois)
+        else:
+            # Only the regions themselves are sent to the workers
+            regions = [((x, y), frame[y:y + h, x:x + w]) for (x, y, w, h) in rois]
+        try:
+            self._tasks.put_nowait((channel, seq, time.monotonic(), regions, frame_ref))
+        except queue.Full:
+            self._dropped.inc()
+            return False
+        self._submitted.inc()
+        return True
+
+    def latest(self, channel: str = "default") -> Optional[FaceResult]:
+        """Return the most recent completed result for `channel` that is not stale."""
+        with self._lock:
+            while True:
+                try:
+                    result = FaceResult(*self._results.get_nowait())
+                except queue.Empty:
+                    break
+                current = self._latest.get(result.channel)
+                if result.face_locations is None or (current is not None and result.seq <= current.seq):
+                    self._stale.inc()
+                    continue
+                self._latest[result.channel] = result
+
+            current = self._latest.get(channel)
+            if current is not None and time.monotonic() - current.timestamp > self.max_age:
+                self._stale.inc()
+                del self._latest[channel]
+                current = None
+            return current
@@ -0,0 +1,260 @@
+import os
+import time
+import logging
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+import numpy as np
+from . import config
+from .capture import TimestampedFrame
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Header fields (int64)
+_HEAD, _SLOTS, _HEIGHT, _WIDTH, _CHANNELS, _CONSUMERS, _CLOSED, _OWNER = range(8)
+_HEADER_SIZE = 8
+# Consumer cursor fields (int64); a cursor with LAST_SEQ < 0 is unused
+_LAST_SEQ, _READ, _SKIPPED = range(3)
+_CURSOR_SIZE = 3
+
+_bus_ids = itertools.count()
+
+def _align(offset: int, to: int = 64) -> int:
+    return (offset + to - 1) // to * to
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Open an existing segment without letting this process's resource tracker remove it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # Before Python 3.13 attaching registers the segment too. The owner and
+    # the processes it started share one tracker, where the owner's
+    # registration must stay; any other process has a tracker of its own,
+    # which would unlink the segment when the process exits.
+    shm = shared_memory.SharedMemory(name=name)
+    owner = int(np.ndarray((_HEADER_SIZE,), np.int64, shm.buf)[_OWNER])
+    if owner != os.getpid() and multiprocessing.parent_process() is None:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+class _FrameRing:
+    """numpy views of a frame bus segment.
+
+    Layout: an int64 header, the sequence number and timestamp of every
+    slot, one cursor per consumer, then the frame slots themselves.
+    """
+
+    def _map(self, shm: shared_memory.SharedMemory, slots: int, shape: Tuple[int, ...],
+             consumers: int):
+        self.shm = shm
+        self.slots = slots
+        self.shape = shape
+        offset = 0
+        self._header = np.ndarray((_HEADER_SIZE,), np.int64, shm.buf, offset)
+        offset += _HEADER_SIZE * 8
+        self._slot_seq = np.ndarray((slots,), np.int64, shm.buf, offset)
+        offset += slots * 8
+        self._slot_time = np.ndarray((slots,), np.float64, shm.buf, offset)
+        offset += slots * 8
+        self._cursors = np.ndarray((consumers, _CURSOR_SIZE), np.int64, shm.buf, offset)
+        offset = _align(offset + consumers * _CURSOR_SIZE * 8)
+        self._frames = np.ndarray((slots,) + shape, np.uint8, shm.buf, offset)
+
+    @staticmethod
+    def _size(slots: int, shape: Tuple[int, ...], consumers: int) -> int:
+        header = (_HEADER_SIZE + 2 * slots + consumers * _CURSOR_SIZE) * 8
+        return _align(header) + slots * int(np.prod(shape))
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def head(self) -> int:
+        """Sequence number of the newest published frame (0 if none yet)."""
+        return int(self._header[_HEAD])
+
+    @property
+    def closed(self) -> bool:
+        return bool(self._header[_CLOSED])
+
+    def read(self, seq: int, copy: bool = False) -> Optional[TimestampedFrame]:
+        """Frame `seq` if it is still in the ring, else None.
+
+        Without `copy` the frame is a view of the shared slot: nothing is
+        copied, but the slot is reused `slots` frames later, so check
+        `is_current` after using it (or pass copy=True to keep it).
+        """
+        slot = seq % self.slots
+        if self._slot_seq[slot] != seq:
+            return None
+        frame = self._frames[slot]
+        if copy:
+            frame = frame.copy()
+        timestamp = float(self._slot_time[slot])
+        # The writer marks a slot -1 while filling it, so an unchanged
+        # number means the frame and timestamp were not overwritten
+        if self._slot_seq[slot] != seq:
+            return None
+        return TimestampedFrame(seq, timestamp, frame)
+
+    def is_current(self, item: TimestampedFrame) -> bool:
+        """True while the slot still holds `item` (its view is unchanged)."""
+        return self._slot_seq[item.seq % self.slots] == item.seq
+
+    def close(self):
+        # Drop the views first: the segment cannot be closed while they exist
+        self._header = self._slot_seq = self._slot_time = self._cursors = self._frames = None
+        self.shm.close()
+
+class SharedFrameBus(_FrameRing):
+    """Single-writer ring of frames in shared memory.
+
+    The capture thread publishes every frame into the next slot. Consumer
+    processes attach with a FrameBusReader by segment name and read frames
+    in place, so frames are never pickled or sent through a pipe. Each
+    consumer registered with `add_consumer` gets a cursor in the segment,
+    from which its lag and skipped frames are reported as metrics.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], slots: int = config.FRAME_BUS_SLOTS,
+                 max_consumers: int = config.FRAME_BUS_MAX_CONSUMERS, camera: str = "camera0"):
+        shape = tuple(int(n) for n in shape)
+        slots = max(2, slots)
+        name = f"framebus-{os.getpid()}-{next(_bus_ids)}"
+        shm = shared_memory.SharedMemory(name=name, create=True,
+                                         size=self._size(slots, shape, max_consumers))
+        self._map(shm, slots, shape, max_consumers)
+        self.camera = camera
+        self._header[:] = 0
+        self._header[_SLOTS] = slots
+        self._header[_HEIGHT] = shape[0]
+        self._header[_WIDTH] = shape[1]
+        self._header[_CHANNELS] = shape[2] if len(shape) > 2 else 0
+        self._header[_CONSUMERS] = max_consumers
+        self._header[_OWNER] = os.getpid()
+        self._slot_seq[:] = 0
+        self._cursors[:] = -1
+        self._consumers: Dict[str, int] = {}
+        self._published = REGISTRY.counter(
+            'frame_bus_published_total', "Frames published to a shared-memory frame bus", camera=camera
+        )
+        logger.info(f"Frame bus {name} for {camera}: {slots} slots of {'x'.join(map(str, shape))} "
+                    f"({shm.size / 1e6:.1f} MB)")
+
+    def add_consumer(self, consumer: str) -> int:
+        """Register a named consumer and return the cursor id its reader should use."""
+        if consumer in self._consumers:
+            return self._consumers[consumer]
+        free = [i for i in range(len(self._cursors)) if self._cursors[i, _LAST_SEQ] < 0]
+        if not free:
+            raise ValueError(f"Frame bus {self.name} has no free consumer cursors")
+        consumer_id = free[0]
+        self._cursors[consumer_id] = 0
+        self._consumers[consumer] = consumer_id
+        REGISTRY.gauge('frame_bus_lag', "Frames a frame bus consumer is behind the newest one",
+                       func=lambda: self.lag(consumer_id), camera=self.camera, consumer=consumer)
+        REGISTRY.gauge('frame_bus_skipped', "Frames a frame bus consumer never read",
+                       func=lambda: self._cursors[consumer_id, _SKIPPED], camera=self.camera,
+                       consumer=consumer)
+        return consumer_id
+
+    def publish(self, frame: np.ndarray, timestamp: Optional[float] = None,
+                seq: Optional[int] = None) -> int:
+        """Copy `frame` into the next slot and return its sequence number.
+
+        `seq` lets the caller keep its own (increasing) numbering.
+        """
+        if frame.shape != self.shape:
+            raise ValueError(f"Frame of shape {frame.shape} does not fit bus of shape {self.shape}")
+        seq = self.head + 1 if seq is None else seq
+        slot = seq % self.slots
+        self._slot_seq[slot] = -1
+        np.copyto(self._frames[slot], frame)
+        self._slot_time[slot] = time.monotonic() if timestamp is None else timestamp
+        self._slot_seq[slot] = seq
+        self._header[_HEAD] = seq
+        self._published.inc()
+        return seq
+
+    def lag(self, consumer_id: int) -> int:
+        """Frames published since the consumer's last read."""
+        return max(0, self.head - int(self._cursors[consumer_id, _LAST_SEQ]))
+
+    def consumers(self) -> Dict[str, Dict[str, int]]:
+        """Lag, frames read and frames skipped of every registered consumer."""
+        return {
+            consumer: {'lag': self.lag(i), 'read': int(self._cursors[i, _READ]),
+                       'skipped': int(self._cursors[i, _SKIPPED])}
+            for consumer, i in self._consumers.items()
+        }
+
+    def close(self):
+        """Tell readers the bus is gone and remove the segment."""
+        if self._header is None:
+            return
+        self._header[_CLOSED] = 1
+        super().close()
+        self.shm.unlink()
+
+class FrameBusReader(_FrameRing):
+    """Reads a SharedFrameBus from any process, given its segment name.
+
+    With a `consumer_id` from `SharedFrameBus.add_consumer` every read
+    advances that consumer's cursor, so the owner can see how far behind
+    it is and how many frames it skipped.
+    """
+
+    def __init__(self, name: str, consumer_id: Optional[int] = None,
+                 poll_interval: float = config.FRAME_BUS_POLL_INTERVAL):
+        shm = _attach(name)
+        header = np.ndarray((_HEADER_SIZE,), np.int64, shm.buf)
+        shape = (int(header[_HEIGHT]), int(header[_WIDTH]))
+        if header[_CHANNELS]:
+            shape += (int(header[_CHANNELS]),)
+        slots, consumers = int(header[_SLOTS]), int(header[_CONSUMERS])
+        del header
+        self._map(shm, slots, shape, consumers)
+        self.consumer_id = consumer_id
+        self.poll_interval = poll_interval
+
+    def read(self, seq: int, copy: bool = False) -> Optional[TimestampedFrame]:
+        item = super().read(seq, copy)
+        if item is not None and self.consumer_id is not None:
+            cursor = self._cursors[self.consumer_id]
+            last_seq = int(cursor[_LAST_SEQ])
+            if seq > last_seq:
+                if last_seq:
+                    cursor[_SKIPPED] += seq - last_seq - 1
+                cursor[_READ] += 1
+                cursor[_LAST_SEQ] = seq
+        return item
+
+    def latest(self, copy: bool = False) -> Optional[TimestampedFrame]:
+        """The newest frame, or None if nothing was published yet."""
+        while True:
+            head = self.head
+            if not head:
+                return None
+            item = self.read(head, copy)
+            # A miss means the writer is filling a slot right now; it will not take long
+            if item is not None or self.closed:
+                return item
+
+    def wait_for_frame(self, after_seq: int = 0, timeout: float = 1.0,
+                       copy: bool = False) -> Optional[TimestampedFrame]:
+        """Wait for a frame newer than `after_seq` and return the newest one.
+
+        Returns None on timeout or once the bus is closed. Waiting polls
+        the shared head every `poll_interval` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while self.head <= after_seq:
+            if self.closed or time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+        return self.latest(copy)
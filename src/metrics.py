@@ -0,0 +1,202 @@
+import time
+import bisect
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+# Latency buckets in seconds, from sub-millisecond stages up to slow network calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = []
+    for key, value in items:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+class Counter:
+    """A value that only goes up."""
+
+    kind = "counter"
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def samples(self, name: str, labels: Labels) -> List[str]:
+        return [f"{name}{_format_labels(labels)} {self._value}"]
+
+class Gauge:
+    """A value read from `func` when metrics are collected, or set directly."""
+
+    kind = "gauge"
+
+    def __init__(self, func: Optional[Callable[[], float]] = None):
+        self.func = func
+        self._value = 0.0
+
+    def set(self, value: float):
+        self._value = value
+
+    @property
+    def value(self) -> float:
+        if self.func is None:
+            return self._value
+        try:
+            return float(self.func())
+        except Exception:
+            return float('nan')
+
+    def samples(self, name: str, labels: Labels) -> List[str]:
+        return [f"{name}{_format_labels(labels)} {self.value}"]
+
+class Histogram:
+    """Cumulative bucket counts plus a rolling window of recent observations.
+
+    Observing is a bisect and a few additions under a lock. The window
+    quantiles are only computed when metrics are collected, and are
+    exported as a separate `<name>_window` gauge so recent latency is
+    visible without rate() over the lifetime buckets.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, window: int = 1024):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._window = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+            self._window.append(value)
+
+    def time(self) -> '_Timer':
+        """Observe the duration of a `with` block."""
+        return _Timer(self)
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def quantiles(self, qs=(0.5, 0.95, 0.99)) -> Dict[float, float]:
+        """Quantiles of the rolling window."""
+        with self._lock:
+            window = list(self._window)
+        if not window:
+            return {}
+        values = np.percentile(window, [q * 100 for q in qs])
+        return dict(zip(qs, (float(v) for v in values)))
+
+    def samples(self, name: str, labels: Labels) -> List[str]:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(labels, ('le', repr(bound)))} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return lines
+
+    def window_samples(self, name: str, labels: Labels) -> List[str]:
+        return [f"{name}_window{_format_labels(labels, ('quantile', str(q)))} {value}"
+                for q, value in self.quantiles().items()]
+
+class _Timer:
+    """Context manager behind Histogram.time (cheaper than a generator-based one)."""
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+class MetricsRegistry:
+    """Named metric families, each with one metric per label set.
+
+    Metrics are created on first use and reused afterwards, so components
+    can ask for the same metric independently. `render` produces the
+    Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._families: Dict[str, Tuple[str, str, Dict[Labels, object]]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str, help_text: str, kind: str, factory, labels: Dict[str, str]):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = (kind, help_text, {})
+                self._families[name] = family
+            elif family[0] != kind:
+                raise ValueError(f"Metric {name} is already registered as a {family[0]}")
+            metrics = family[2]
+            if key not in metrics:
+                metrics[key] = factory()
+            return metrics[key]
+
+    def counter(self, name: str, help_text: str, **labels) -> Counter:
+        return self._get(name, help_text, Counter.kind, Counter, labels)
+
+    def gauge(self, name: str, help_text: str, func: Optional[Callable[[], float]] = None,
+              **labels) -> Gauge:
+        gauge = self._get(name, help_text, Gauge.kind, Gauge, labels)
+        if func is not None:
+            gauge.func = func
+        return gauge
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+                  **labels) -> Histogram:
+        return self._get(name, help_text, Histogram.kind, lambda: Histogram(buckets), labels)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format."""
+        with self._lock:
+            families = [(name, kind, help_text, list(metrics.items()))
+                        for name, (kind, help_text, metrics) in sorted(self._families.items())]
+        lines = []
+        for name, kind, help_text, metrics in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in metrics:
+                lines.extend(metric.samples(name, labels))
+            if kind == Histogram.kind:
+                lines.append(f"# HELP {name}_window {help_text} (recent observations)")
+                lines.append(f"# TYPE {name}_window gauge")
+                for labels, metric in metrics:
+                    lines.extend(metric.window_samples(name, labels))
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,153 @@
+import cv2
+import time
+import logging
+from typing import List, Optional, Tuple
+import numpy as np
+from . import config
+from .background_models import BackgroundModel, create_background_model
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+Box = Tuple[int, int, int, int]
+
+def _odd(value: float) -> int:
+    """Round to the nearest odd integer >= 1 (Gaussian kernels must be odd)."""
+    size = max(1, int(round(value)))
+    return size if size % 2 == 1 else size + 1
+
+class MotionEngine:
+    """Motion detection on a reduced-resolution copy of the frame.
+
+    Detection runs either on a frame resized by `scale` or on an image
+    pyramid level (each level halves the resolution). All intermediate
+    images are written into buffers allocated once per input resolution,
+    so steady-state processing does not allocate frame-sized arrays.
+    Blur size, dilation and the minimum contour area are scaled with the
+    resolution, and bounding boxes are mapped back to full-resolution
+    coordinates. With scale 1.0 and no pyramid levels the results are
+    identical to full-resolution processing.
+
+    The foreground mask comes from a pluggable BackgroundModel, selected by
+    `config.BACKGROUND_MODEL` unless one is passed in.
+    """
+
+    def __init__(self, scale: float = config.MOTION_DOWNSCALE,
+                 pyramid_levels: int = config.MOTION_PYRAMID_LEVELS,
+                 threshold: int = config.MOTION_THRESHOLD,
+                 blur_size: Tuple[int, int] = config.GAUSSIAN_BLUR_SIZE,
+                 min_area: float = config.MIN_CONTOUR_AREA,
+                 background_model: Optional[BackgroundModel] = None, camera: str = "default"):
+        if pyramid_levels > 0:
+            scale = 1.0 / (2 ** pyramid_levels)
+        if not 0 < scale <= 1:
+            raise ValueError(f"Motion scale must be in (0, 1], got {scale}")
+        self.scale = scale
+        self.pyramid_levels = pyramid_levels
+        self.min_area = min_area
+        self.background_model = background_model or create_background_model(threshold=threshold)
+        self.blur_size = (_odd(blur_size[0] * scale), _odd(blur_size[1] * scale))
+        self.dilate_iterations = max(1, int(round(2 * scale)))
+        self._input_shape = None
+        self._stage_times = [
+            REGISTRY.histogram('pipeline_stage_seconds', "Time spent in each pipeline stage",
+                               camera=camera, stage=stage)
+            for stage in ('reduce', 'blur_diff', 'contours')
+        ]
+
+    def reset(self):
+        """Forget the reference frame."""
+        self.background_model.reset()
+
+    def _allocate(self, shape: Tuple[int, ...]):
+        """Allocate the working buffers for a given input frame shape."""
+        height, width = shape[:2]
+        self._gray = np.empty((height, width), dtype=np.uint8)
+
+        self._pyramid = []
+        if self.pyramid_levels > 0:
+            h, w = height, width
+            for _ in range(self.pyramid_levels):
+                h, w = (h + 1) // 2, (w + 1) // 2
+                self._pyramid.append(np.empty((h, w), dtype=np.uint8))
+            small_h, small_w = h, w
+        elif self.scale < 1:
+            small_w = max(1, int(round(width * self.scale)))
+            small_h = max(1, int(round(height * self.scale)))
+            self._pyramid.append(np.empty((small_h, small_w), dtype=np.uint8))
+        else:
+            small_h, small_w = height, width
+
+        self._blurred = np.empty((small_h, small_w), dtype=np.uint8)
+        self._thresh = np.empty((small_h, small_w), dtype=np.uint8)
+        self._dilated = np.empty((small_h, small_w), dtype=np.uint8)
+        self._scale_x = width / small_w
+        self._scale_y = height / small_h
+        self._input_shape = shape
+        self.background_model.reset()
+        logger.info(f"Motion engine working at {small_w}x{small_h} for {width}x{height} input")
+
+    def _reduce(self, frame: np.ndarray) -> np.ndarray:
+        """Convert to grayscale and shrink to the working resolution."""
+        if frame.ndim == 3:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        else:
+            gray = frame
+
+        if self.pyramid_levels > 0:
+            for level in self._pyramid:
+                cv2.pyrDown(gray, dst=level, dstsize=(level.shape[1], level.shape[0]))
+                gray = level
+        elif self._pyramid:
+            small = self._pyramid[0]
+            cv2.resize(gray, (small.shape[1], small.shape[0]), dst=small,
+                       interpolation=cv2.INTER_AREA)
+            gray = small
+        return gray
+
+    def detect(self, frame: np.ndarray) -> Optional[List[Box]]:
+        """Detect motion against the background model.
+
+        Returns full-resolution bounding boxes (x, y, w, h) of the moving
+        regions, or None while there is no reference frame yet.
+        """
+        if frame.shape != self._input_shape:
+            self._allocate(frame.shape)
+
+        reduce_time, blur_diff_time, contours_time = self._stage_times
+        start = time.perf_counter()
+        reduced = self._reduce(frame)
+        reduced_at = time.perf_counter()
+        reduce_time.observe(reduced_at - start)
+
+        cv2.GaussianBlur(reduced, self.blur_size, 0, dst=self._blurred)
+        mask = self.background_model.apply(self._blurred, self._thresh)
+        masked_at = time.perf_counter()
+        blur_diff_time.observe(masked_at - reduced_at)
+        if mask is None:
+            return None
+
+        cv2.dilate(self._thresh, None, dst=self._dilated, iterations=self.dilate_iterations)
+        boxes = self._find_boxes(self._dilated)
+        contours_time.observe(time.perf_counter() - masked_at)
+        return boxes
+
+    def _find_boxes(self, mask: np.ndarray) -> List[Box]:
+        """Extract full-resolution bounding boxes from a foreground mask."""
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        min_area = self.min_area / (self._scale_x * self._scale_y)
+        height, width = self._input_shape[:2]
+        boxes = []
+        for contour in contours:
+            if cv2.contourArea(contour) < min_area:
+                continue
+            x, y, w, h = cv2.boundingRect(contour)
+            if self._scale_x != 1 or self._scale_y != 1:
+                x0 = int(x * self._scale_x)
+                y0 = int(y * self._scale_y)
+                x1 = min(width, int(np.ceil((x + w) * self._scale_x)))
+                y1 = min(height, int(np.ceil((y + h) * self._scale_y)))
+                x, y, w, h = x0, y0, x1 - x0, y1 - y0
+            boxes.append((x, y, w, h))
+        return boxes
@@ -1,7 +1,7 @@
-import smtplib
 import mimetypes
 from email.message import EmailMessage
 from . import config
+from .connections import get_smtp_manager
 import logging
 from typing import List
 
@@ -13,6 +13,7 @@ class EmailNotifier:
         self.sender = config.EMAIL_SENDER
         self.receiver = config.EMAIL_RECEIVER
         self.password = config.EMAIL_PASSWORD
+        self.smtp = get_smtp_manager(self.sender, self.password)
         
     def send_notification(self, image_paths: List[str]):
         """Send email notification with multiple captured images."""
@@ -42,12 +43,8 @@ class EmailNotifier:
                     filename=f"motion_detected_{idx}.png"
                 )
             
-            # Send email
-            with smtplib.SMTP("smtp.gmail.com", 587) as server:
-                server.ehlo()
-                server.starttls()
-                server.login(self.sender, self.password)
-                server.send_message(email_message)
+            # Send email over a pooled session
+            self.smtp.send_message(email_message)
                 
             logger.info("Email notification sent successfully")
             
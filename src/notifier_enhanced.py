@@ -1,15 +1,13 @@
-import smtplib
-import mimetypes
+import time
 from email.message import EmailMessage
-from twilio.rest import Client
 from datetime import datetime
-from PIL import Image, ImageDraw, ImageFont
 import cv2
 import numpy as np
-import os
-from typing import List, Optional
+from typing import List, Optional, Union
 import logging
 from . import config
+from .connections import get_smtp_manager, get_twilio_client
+from .metrics import REGISTRY
 
 logger = logging.getLogger(__name__)
 
@@ -18,53 +16,74 @@ class EnhancedNotifier:
         self.email_sender = config.EMAIL_SENDER
         self.email_receiver = config.EMAIL_RECEIVER
         self.email_password = config.EMAIL_PASSWORD
+        self.smtp = get_smtp_manager(self.email_sender, self.email_password)
         
-        # Twilio setup (optional)
-        self.twilio_client = None
-        if hasattr(config, 'TWILIO_ACCOUNT_SID') and hasattr(config, 'TWILIO_AUTH_TOKEN'):
-            self.twilio_client = Client(config.TWILIO_ACCOUNT_SID, config.TWILIO_AUTH_TOKEN)
+        # Twilio setup (optional), shared so its HTTP session is reused
+        self.twilio_client = get_twilio_client()
+        self.last_sms_ms = 0.0
+        self._encode_time = REGISTRY.histogram(
+            'notification_stage_seconds', "Time spent preparing and sending notifications", stage='encode'
+        )
+        self._email_time = REGISTRY.histogram(
+            'notification_stage_seconds', "Time spent preparing and sending notifications", stage='email'
+        )
+        self._sms_time = REGISTRY.histogram(
+            'notification_stage_seconds', "Time spent preparing and sending notifications", stage='sms'
+        )
+        self._failures = REGISTRY.counter('notification_failures_total', "Notifications that failed to send")
             
-    def add_timestamp(self, image: np.ndarray) -> np.ndarray:
-        """Add timestamp to image."""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        img_pil = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-        draw = ImageDraw.Draw(img_pil)
+    def add_timestamp(self, image: np.ndarray, when: Optional[datetime] = None) -> np.ndarray:
+        """Add timestamp to image (drawn in place with OpenCV's built-in font)."""
+        timestamp = (when or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        scale, thickness = 0.6, 1
         
-        # Position timestamp at bottom-right
-        w, h = img_pil.size
-        text_size = 20
-        try:
-            font = ImageFont.truetype("arial.ttf", text_size)
-        except:
-            font = ImageFont.load_default()
-            
-        # Add semi-transparent background for timestamp
-        text_bbox = draw.textbbox((0, 0), timestamp, font=font)
-        text_width = text_bbox[2] - text_bbox[0]
-        text_height = text_bbox[3] - text_bbox[1]
+        # Position timestamp at bottom-right on a dark background
+        h, w = image.shape[:2]
+        (text_width, text_height), baseline = cv2.getTextSize(timestamp, font, scale, thickness)
         margin = 10
-        rect_coords = [
-            w - text_width - margin * 2,
-            h - text_height - margin * 2,
-            w - margin,
-            h - margin
-        ]
-        draw.rectangle(rect_coords, fill=(0, 0, 0, 128))
-        
-        # Draw timestamp
-        draw.text(
-            (w - text_width - margin, h - text_height - margin),
+        cv2.rectangle(
+            image,
+            (w - text_width - margin * 2, h - text_height - baseline - margin * 2),
+            (w - margin, h - margin),
+            (0, 0, 0),
+            -1
+        )
+        cv2.putText(
+            image,
             timestamp,
-            font=font,
-            fill=(255, 255, 255)
+            (w - text_width - margin - margin // 2, h - baseline - margin - margin // 2),
+            font,
+            scale,
+            (255, 255, 255),
+            thickness,
+            cv2.LINE_AA
         )
+        return image
+        
+    def encode_attachment(self, image: np.ndarray, when: Optional[datetime] = None) -> bytes:
+        """Timestamp a frame and encode it straight to in-memory image bytes."""
+        with self._encode_time.time():
+            image = self.add_timestamp(image.copy(), when)
+            params = []
+            if config.ATTACHMENT_FORMAT == '.jpg':
+                params = [cv2.IMWRITE_JPEG_QUALITY, config.ATTACHMENT_JPEG_QUALITY]
+            ret, buffer = cv2.imencode(config.ATTACHMENT_FORMAT, image, params)
+        if not ret:
+            raise ValueError("Failed to encode attachment")
+        return buffer.tobytes()
         
-        return cv2.cvtColor(np.array(img_pil), cv2.COLOR_RGB2BGR)
+    def send_notification(self, images: List[Union[str, bytes, np.ndarray]], face_detected: bool = False,
+                         motion_direction: Optional[str] = None, detected_at: Optional[datetime] = None,
+                         motion_speed: Optional[float] = None, dwell_time: Optional[float] = None):
+        """Send enhanced notification with multiple images and detection details.
         
-    def send_notification(self, image_paths: List[str], face_detected: bool = False,
-                         motion_direction: Optional[str] = None):
-        """Send enhanced notification with multiple images and detection details."""
+        Images may be frames, already encoded attachment bytes (see
+        `encode_attachment`) or image file paths.
+        """
         try:
+            detected_at = detected_at or datetime.now()
+            
             # Prepare email
             email_message = EmailMessage()
             email_message["Subject"] = f"Security Alert: {'Face' if face_detected else 'Motion'} Detected!"
@@ -74,48 +93,41 @@ class EnhancedNotifier:
             # Create detailed message
             content = [
                 "Security Alert Details:",
-                f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                f"Time: {detected_at.strftime('%Y-%m-%d %H:%M:%S')}",
                 f"Detection Type: {'Face Detected' if face_detected else 'Motion Detected'}",
             ]
             
             if motion_direction:
                 content.append(f"Movement Direction: {motion_direction}")
+            if motion_speed:
+                content.append(f"Movement Speed: {motion_speed:.0f} px/s")
+            if dwell_time:
+                content.append(f"Time in View: {dwell_time:.1f} s")
                 
-            content.append(f"\nAttached are {len(image_paths)} images captured during the event.")
+            content.append(f"\nAttached are {len(images)} images captured during the event.")
             
             email_message.set_content("\n".join(content))
             
-            # Attach images with timestamps
-            for idx, image_path in enumerate(image_paths, 1):
-                # Read image and add timestamp
-                image = cv2.imread(image_path)
-                if image is not None:
-                    image_with_timestamp = self.add_timestamp(image)
-                    temp_path = f"{os.path.splitext(image_path)[0]}_timestamped.png"
-                    cv2.imwrite(temp_path, image_with_timestamp)
+            # Attach images with timestamps, encoded in memory
+            subtype = 'jpeg' if config.ATTACHMENT_FORMAT == '.jpg' else config.ATTACHMENT_FORMAT.lstrip('.')
+            for idx, image in enumerate(images, 1):
+                if isinstance(image, str):
+                    image = cv2.imread(image)
+                    if image is None:
+                        continue
+                if isinstance(image, np.ndarray):
+                    image = self.encode_attachment(image, detected_at)
                     
-                    mime_type, _ = mimetypes.guess_type(temp_path)
-                    mime_type = mime_type or 'application/octet-stream'
-                    mime_maintype, mime_subtype = mime_type.split('/')
-                    
-                    with open(temp_path, "rb") as file:
-                        content = file.read()
-                    email_message.add_attachment(
-                        content,
-                        maintype=mime_maintype,
-                        subtype=mime_subtype,
-                        filename=f"detection_{idx}.png"
-                    )
-                    
-                    # Clean up temporary file
-                    os.remove(temp_path)
+                email_message.add_attachment(
+                    image,
+                    maintype='image',
+                    subtype=subtype,
+                    filename=f"detection_{idx}{config.ATTACHMENT_FORMAT}"
+                )
             
-            # Send email
-            with smtplib.SMTP("smtp.gmail.com", 587) as server:
-                server.ehlo()
-                server.starttls()
-                server.login(self.email_sender, self.email_password)
-                server.send_message(email_message)
+            # Send email over a pooled session
+            with self._email_time.time():
+                self.smtp.send_message(email_message)
                 
             logger.info("Enhanced email notification sent successfully")
             
@@ -123,16 +135,20 @@ class EnhancedNotifier:
             if self.twilio_client and hasattr(config, 'TWILIO_PHONE_FROM') and hasattr(config, 'TWILIO_PHONE_TO'):
                 sms_message = (
                     f"Security Alert: {'Face' if face_detected else 'Motion'} detected at "
-                    f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}. "
+                    f"{detected_at.strftime('%Y-%m-%d %H:%M:%S')}. "
                     "Check your email for images."
                 )
+                start = time.perf_counter()
                 self.twilio_client.messages.create(
                     body=sms_message,
                     from_=config.TWILIO_PHONE_FROM,
                     to=config.TWILIO_PHONE_TO
                 )
-                logger.info("SMS notification sent successfully")
+                self.last_sms_ms = (time.perf_counter() - start) * 1000
+                self._sms_time.observe(self.last_sms_ms / 1000)
+                logger.info(f"SMS notification sent successfully in {self.last_sms_ms:.0f} ms")
                 
         except Exception as e:
+            self._failures.inc()
             logger.error(f"Failed to send enhanced notification: {str(e)}")
             raise
@@ -0,0 +1,241 @@
+import json
+import time
+import random
+import sqlite3
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional
+from . import config
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt);
+CREATE TABLE IF NOT EXISTS outbox_attachments (
+    notification_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (notification_id, position)
+);
+"""
+
+class NotificationOutbox:
+    """Durable queue of notifications delivered by background workers.
+
+    `enqueue` only appends a row to an SQLite database in WAL mode and
+    returns. Worker threads claim due rows, pass their payload and binary
+    attachments to `handler` and delete them once it returns. Failed deliveries are retried with
+    exponential backoff up to `max_attempts`; after that the row is kept as
+    'failed' without its attachments. Rows that were in flight when the
+    process died are picked up again on the next start.
+    """
+
+    def __init__(self, handler: Callable[[Dict[str, Any], List[bytes]], None],
+                 path: str = config.OUTBOX_PATH,
+                 workers: int = config.OUTBOX_WORKERS,
+                 max_attempts: int = config.OUTBOX_MAX_ATTEMPTS,
+                 base_delay: float = config.OUTBOX_RETRY_BASE_DELAY,
+                 max_delay: float = config.OUTBOX_RETRY_MAX_DELAY):
+        self.handler = handler
+        self.path = path
+        self.workers = max(1, workers)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._running = False
+        self._new_work = False
+        self._threads = []
+
+        self._conn = self._connect()
+        self._conn.executescript(SCHEMA)
+        recovered = self._conn.execute(
+            "UPDATE outbox SET status = 'pending' WHERE status = 'sending'"
+        ).rowcount
+        if recovered:
+            logger.info(f"Recovered {recovered} interrupted notifications")
+        # Failed notifications are kept for inspection, but not their attachments
+        self._conn.execute(
+            "DELETE FROM outbox_attachments WHERE notification_id IN "
+            "(SELECT id FROM outbox WHERE status = 'failed')"
+        )
+        # Counted in SQLite, so only when metrics are scraped
+        REGISTRY.gauge('queue_depth', "Items waiting in an internal queue", func=self.pending, queue='outbox')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def start(self):
+        """Start the delivery workers."""
+        if self._running:
+            return
+        self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"OutboxWorker-{i}")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Notification outbox started with {self.workers} workers ({self.pending()} pending)")
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the workers. Undelivered notifications stay in the outbox."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def enqueue(self, payload: Dict[str, Any], attachments: Optional[List[bytes]] = None) -> int:
+        """Persist a notification and its attachments for delivery and return its id."""
+        data = json.dumps(payload)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                cursor = self._conn.execute(
+                    "INSERT INTO outbox (payload, next_attempt, created_at) VALUES (?, ?, ?)",
+                    (data, 0.0, time.time())
+                )
+                self._conn.executemany(
+                    "INSERT INTO outbox_attachments (notification_id, position, data) VALUES (?, ?, ?)",
+                    [(cursor.lastrowid, i, attachment) for i, attachment in enumerate(attachments or [])]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        with self._cond:
+            self._new_work = True
+            self._cond.notify()
+        return cursor.lastrowid
+
+    def pending(self) -> int:
+        """Number of notifications waiting to be delivered."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')"
+            ).fetchone()[0]
+
+    def _claim(self, conn: sqlite3.Connection):
+        """Atomically mark the oldest due notification as in flight.
+        Returns (id, payload, attempts) or the delay until the next one is due.
+        """
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, payload, attempts FROM outbox "
+                "WHERE status = 'pending' AND next_attempt <= ? ORDER BY id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                next_due = conn.execute(
+                    "SELECT MIN(next_attempt) FROM outbox WHERE status = 'pending'"
+                ).fetchone()[0]
+                conn.execute("COMMIT")
+                return None, (next_due - now if next_due is not None else None)
+            conn.execute("UPDATE outbox SET status = 'sending' WHERE id = ?", (row[0],))
+            conn.execute("COMMIT")
+            return row, None
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _transaction(self, conn: sqlite3.Connection, statements):
+        """Run (sql, params) statements as one transaction, rolled back if any fails."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in statements:
+                conn.execute(sql, params)
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    def _update(self, conn: sqlite3.Connection, notification_id: int, statements, retries: int = 3):
+        """Record the outcome of a delivery, retrying briefly if the database is busy.
+
+        If it still fails the row stays 'sending' and is delivered again
+        after the next restart.
+        """
+        for attempt in range(1, retries + 1):
+            try:
+                self._transaction(conn, statements)
+                return
+            except sqlite3.Error as e:
+                logger.error(f"Could not update notification {notification_id} "
+                             f"(attempt {attempt}/{retries}): {str(e)}")
+                if attempt < retries and self._running:
+                    time.sleep(1.0)
+
+    def _retry_delay(self, attempts: int) -> float:
+        """Exponential backoff with jitter."""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while self._running:
+                try:
+                    row, wait = self._claim(conn)
+                except sqlite3.Error as e:
+                    logger.error(f"Outbox error: {str(e)}")
+                    row, wait = None, 1.0
+
+                if row is None:
+                    with self._cond:
+                        self._cond.wait_for(lambda: self._new_work or not self._running,
+                                            timeout=min(wait, 5.0) if wait is not None else 5.0)
+                        self._new_work = False
+                    continue
+
+                notification_id, data, attempts = row
+                try:
+                    attachments = [blob for (blob,) in conn.execute(
+                        "SELECT data FROM outbox_attachments WHERE notification_id = ? ORDER BY position",
+                        (notification_id,)
+                    )]
+                    self.handler(json.loads(data), attachments)
+                except Exception as e:
+                    attempts += 1
+                    if attempts >= self.max_attempts:
+                        logger.error(f"Giving up on notification {notification_id} "
+                                     f"after {attempts} attempts: {str(e)}")
+                        self._update(conn, notification_id, [
+                            ("UPDATE outbox SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                             (attempts, str(e), notification_id)),
+                            ("DELETE FROM outbox_attachments WHERE notification_id = ?", (notification_id,)),
+                        ])
+                    else:
+                        delay = self._retry_delay(attempts)
+                        logger.warning(f"Notification {notification_id} failed (attempt {attempts}), "
+                                       f"retrying in {delay:.1f}s: {str(e)}")
+                        self._update(conn, notification_id, [
+                            ("UPDATE outbox SET status = 'pending', attempts = ?, next_attempt = ?, "
+                             "last_error = ? WHERE id = ?",
+                             (attempts, time.time() + delay, str(e), notification_id)),
+                        ])
+                    continue
+
+                self._update(conn, notification_id, [
+                    ("DELETE FROM outbox_attachments WHERE notification_id = ?", (notification_id,)),
+                    ("DELETE FROM outbox WHERE id = ?", (notification_id,)),
+                ])
+        finally:
+            conn.close()
@@ -0,0 +1,45 @@
+import time
+import logging
+from typing import Optional
+from . import config
+
+logger = logging.getLogger(__name__)
+
+class AdaptiveRateController:
+    """Chooses how often a camera pipeline analyses a frame.
+
+    While the scene is quiet frames are analysed at `idle_fps`. The first
+    frame with motion switches to `active_fps`, which is kept until
+    `hold_time` seconds have passed without motion.
+    """
+
+    def __init__(self, idle_fps: float = config.ANALYSIS_IDLE_FPS,
+                 active_fps: float = config.CAMERA_MAX_FPS,
+                 hold_time: float = config.ANALYSIS_ACTIVE_HOLD):
+        self.configure(idle_fps, active_fps, hold_time)
+        self._last_activity: Optional[float] = None
+        self.active = False
+
+    def configure(self, idle_fps: float, active_fps: float, hold_time: float):
+        """Change the rates; the current idle/active state is kept."""
+        self.idle_interval = 1.0 / idle_fps if idle_fps else 0.0
+        self.active_interval = 1.0 / active_fps if active_fps else 0.0
+        self.hold_time = hold_time
+
+    @property
+    def interval(self) -> float:
+        """Seconds between the starts of two analysed frames."""
+        return self.active_interval if self.active else self.idle_interval
+
+    def update(self, activity: bool, now: Optional[float] = None) -> float:
+        """Record whether the last frame had activity and return the next interval."""
+        now = time.monotonic() if now is None else now
+        if activity:
+            self._last_activity = now
+            if not self.active:
+                self.active = True
+                logger.debug("Activity: switching to full analysis rate")
+        elif self.active and (self._last_activity is None or now - self._last_activity >= self.hold_time):
+            self.active = False
+            logger.debug("Scene quiet: switching to idle analysis rate")
+        return self.interval
@@ -0,0 +1,232 @@
+import os
+import json
+import math
+import time
+import threading
+import logging
+from datetime import date, datetime, time as dtime
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple, Union
+from . import config
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+Window = Tuple[dtime, dtime]
+
+def parse_time(value: Union[str, dtime]) -> dtime:
+    """Parse "HH:MM" (24-hour format)."""
+    if isinstance(value, dtime):
+        return value
+    return datetime.strptime(value, '%H:%M').time()
+
+def parse_windows(windows) -> Tuple[Window, ...]:
+    """Parse [["HH:MM", "HH:MM"], ...] into a tuple of (start, end) times."""
+    return tuple((parse_time(start), parse_time(end)) for start, end in windows)
+
+def format_windows(windows) -> List[List[str]]:
+    return [[start.strftime('%H:%M'), end.strftime('%H:%M')] for start, end in windows]
+
+class Settings(NamedTuple):
+    """One immutable, versioned set of runtime settings."""
+    version: int
+    updated_at: float  # time.time() of the update that produced this version
+    weekly_windows: Tuple[Tuple[Window, ...], ...]  # Indexed by weekday, 0 = Monday
+    holidays: Mapping[date, Tuple[Window, ...]]
+    day_sensitivity: int
+    night_sensitivity: int
+    day_start: dtime
+    night_start: dtime
+    inactivity_timeout: float
+    face_detection_enabled: bool
+    face_motion_gated: bool
+    analysis_idle_fps: float
+    analysis_active_hold: float
+    camera_max_fps: float
+    stream_max_fps: float
+    stream_jpeg_quality: int
+
+def default_settings() -> Settings:
+    """Settings as given by the constants in config.py."""
+    default = ((parse_time(config.DEFAULT_START_TIME), parse_time(config.DEFAULT_END_TIME)),)
+    weekly = [default] * 7
+    for day, windows in config.SCHEDULE_WINDOWS.items():
+        weekly[WEEKDAYS.index(day)] = parse_windows(windows)
+    return Settings(
+        version=0,
+        updated_at=0.0,
+        weekly_windows=tuple(weekly),
+        holidays=MappingProxyType({date.fromisoformat(day): parse_windows(windows)
+                                   for day, windows in config.SCHEDULE_HOLIDAYS.items()}),
+        day_sensitivity=config.DAY_SENSITIVITY,
+        night_sensitivity=config.NIGHT_SENSITIVITY,
+        day_start=parse_time(config.DAY_START),
+        night_start=parse_time(config.NIGHT_START),
+        inactivity_timeout=config.INACTIVITY_TIMEOUT,
+        face_detection_enabled=config.FACE_DETECTION_ENABLED,
+        face_motion_gated=config.FACE_MOTION_GATED,
+        analysis_idle_fps=config.ANALYSIS_IDLE_FPS,
+        analysis_active_hold=config.ANALYSIS_ACTIVE_HOLD,
+        camera_max_fps=config.CAMERA_MAX_FPS,
+        stream_max_fps=config.STREAM_MAX_FPS,
+        stream_jpeg_quality=config.STREAM_JPEG_QUALITY,
+    )
+
+def to_json(settings: Settings) -> Dict[str, Any]:
+    """JSON-friendly form of a snapshot (also the on-disk format)."""
+    data = settings._asdict()
+    data['weekly_windows'] = {WEEKDAYS[day]: format_windows(windows)
+                              for day, windows in enumerate(settings.weekly_windows)}
+    data['holidays'] = {day.isoformat(): format_windows(windows)
+                        for day, windows in sorted(settings.holidays.items())}
+    data['day_start'] = settings.day_start.strftime('%H:%M')
+    data['night_start'] = settings.night_start.strftime('%H:%M')
+    return data
+
+def from_json(data: Dict[str, Any], base: Settings) -> Dict[str, Any]:
+    """Convert JSON values into typed field changes on top of `base`.
+
+    Weekdays missing from `weekly_windows` keep their windows from `base`.
+    Raises ValueError (or KeyError/TypeError) on malformed input.
+    """
+    changes = {}
+    for field, value in data.items():
+        if field in ('version', 'updated_at'):
+            continue
+        if field not in Settings._fields:
+            raise ValueError(f"Unknown setting '{field}'")
+        if field == 'weekly_windows':
+            weekly = list(base.weekly_windows)
+            for day, windows in value.items():
+                weekly[WEEKDAYS.index(day)] = parse_windows(windows)
+            value = tuple(weekly)
+        elif field == 'holidays':
+            value = MappingProxyType({date.fromisoformat(day): parse_windows(windows)
+                                      for day, windows in value.items()})
+        elif field in ('day_start', 'night_start'):
+            value = parse_time(value)
+        elif Settings.__annotations__[field] is bool:
+            if not isinstance(value, bool):
+                raise ValueError(f"{field} must be true or false")
+        else:
+            value = Settings.__annotations__[field](value)
+        changes[field] = value
+    return changes
+
+def validate(settings: Settings):
+    """Raise ValueError if the snapshot is not usable."""
+    if len(settings.weekly_windows) != 7:
+        raise ValueError("weekly_windows needs an entry for every weekday")
+    if settings.day_sensitivity <= 0 or settings.night_sensitivity <= 0:
+        raise ValueError("sensitivity must be positive")
+    if settings.day_start == settings.night_start:
+        raise ValueError("day_start and night_start must differ")
+    for field, kind in Settings.__annotations__.items():
+        if kind is float and not math.isfinite(getattr(settings, field)):
+            raise ValueError(f"{field} must be a finite number")
+    if settings.inactivity_timeout < 0 or settings.analysis_active_hold < 0:
+        raise ValueError("timeouts must not be negative")
+    if settings.analysis_idle_fps < 0 or settings.camera_max_fps < 0 or settings.stream_max_fps <= 0:
+        raise ValueError("frame rates must not be negative")
+    for field in ('analysis_idle_fps', 'camera_max_fps', 'stream_max_fps'):
+        if getattr(settings, field) > config.RUNTIME_MAX_FPS:
+            raise ValueError(f"{field} must be at most {config.RUNTIME_MAX_FPS}")
+    if not 1 <= settings.stream_jpeg_quality <= 100:
+        raise ValueError("stream_jpeg_quality must be between 1 and 100")
+
+class VersionConflict(Exception):
+    """The settings changed since the version the caller based its update on."""
+
+class RuntimeConfig:
+    """Holds the current Settings snapshot behind a single reference.
+
+    Readers call `current()` and keep using that snapshot for the whole
+    frame: no locks, and never a mix of two versions. Writers are
+    serialised; each update builds a new snapshot, validates it, persists
+    it to `path` and only then swaps the reference, so a rejected or
+    failed update leaves the old version in place. Subscribers are called
+    with every new snapshot.
+    """
+
+    def __init__(self, path: Optional[str] = config.RUNTIME_CONFIG_PATH):
+        self.path = path
+        self._write_lock = threading.Lock()
+        self._subscribers: List[Callable[[Settings], None]] = []
+        self._settings = self._load()
+
+    def _load(self) -> Settings:
+        settings = default_settings()
+        if not self.path or not os.path.exists(self.path):
+            return settings
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            loaded = settings._replace(version=int(data.get('version', 0)),
+                                       updated_at=float(data.get('updated_at', 0.0)),
+                                       **from_json(data, settings))
+            validate(loaded)
+        except (OSError, KeyError, TypeError, ValueError, AttributeError) as e:
+            logger.warning(f"Ignoring invalid runtime config {self.path}: {str(e)}")
+            return settings
+        logger.info(f"Loaded runtime config version {loaded.version} from {self.path}")
+        return loaded
+
+    def current(self) -> Settings:
+        """The snapshot in effect now."""
+        return self._settings
+
+    @property
+    def version(self) -> int:
+        return self._settings.version
+
+    def subscribe(self, callback: Callable[[Settings], None]):
+        """Call `callback(settings)` after every update."""
+        with self._write_lock:
+            self._subscribers.append(callback)
+
+    def update(self, changes: Union[Dict[str, Any], Callable[[Settings], Dict[str, Any]]],
+               expected_version: Optional[int] = None) -> Settings:
+        """Apply typed field `changes` (or a function of the current snapshot
+        returning them) as a new version and return it.
+
+        Raises VersionConflict if `expected_version` is given and is not the
+        current version, and ValueError if the result does not validate.
+        """
+        with self._write_lock:
+            current = self._settings
+            if expected_version is not None and expected_version != current.version:
+                raise VersionConflict(f"settings are at version {current.version}, not {expected_version}")
+            if callable(changes):
+                changes = changes(current)
+            settings = current._replace(version=current.version + 1, updated_at=time.time(), **changes)
+            validate(settings)
+            self._persist(settings)
+            self._settings = settings
+            subscribers = list(self._subscribers)
+        logger.info(f"Runtime config updated to version {settings.version}: {', '.join(sorted(changes))}")
+        for callback in subscribers:
+            try:
+                callback(settings)
+            except Exception as e:
+                logger.error(f"Runtime config subscriber failed: {str(e)}")
+        return settings
+
+    def _persist(self, settings: Settings):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(to_json(settings), f, indent=2)
+        os.replace(tmp_path, self.path)
+
+_runtime_config: Optional[RuntimeConfig] = None
+_lock = threading.Lock()
+
+def get_runtime_config() -> RuntimeConfig:
+    """Return the shared runtime config, loading it on first use."""
+    global _runtime_config
+    with _lock:
+        if _runtime_config is None:
+            _runtime_config = RuntimeConfig()
+        return _runtime_config
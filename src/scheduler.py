@@ -1,44 +1,197 @@
 import schedule
 import time
-from datetime import datetime, time as dtime
+import threading
+from datetime import date, datetime, timedelta, time as dtime
+from types import MappingProxyType
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 import logging
+from . import config
+from .runtime_config import WEEKDAYS, RuntimeConfig, Settings, Window, get_runtime_config
 
 logger = logging.getLogger(__name__)
 
+class ScheduleState(NamedTuple):
+    """Schedule state that holds until `next_transition`."""
+    version: int  # Runtime config version the state was computed from
+    monitoring: bool
+    period: str  # 'day' or 'night'
+    sensitivity: int
+    next_transition: float  # time.monotonic() at which the state must be recomputed
+    next_transition_at: datetime
+
 class MonitoringSchedule:
-    def __init__(self):
-        self.active_hours = {
-            'start': dtime(0, 0),  # Default: midnight
-            'end': dtime(23, 59)   # Default: 11:59 PM
-        }
-        self.sensitivity_levels = {
-            'day': 3000,    # Higher threshold during day
-            'night': 2000   # Lower threshold at night
-        }
-        
+    """Weekly monitoring windows with holiday overrides and day/night sensitivity.
+
+    Each weekday has its own list of (start, end) windows; a window whose
+    end is before its start runs overnight, and the end minute is included.
+    A holiday replaces the windows of its date (an empty list means no
+    monitoring that day). The current state and the moment it next changes
+    are computed once per transition, so `is_monitoring_time` only compares
+    a monotonic timestamp. Listeners are told whenever the sensitivity in
+    effect changes, either at a day/night boundary or through
+    `set_sensitivity`.
+    """
+
+    def __init__(self, settings: Optional[RuntimeConfig] = None):
+        # Windows, holidays and sensitivity live in the runtime config snapshot
+        self.settings = settings or get_runtime_config()
+        self._cond = threading.Condition()
+        self._changes = 0  # Bumped on every publish and wake, under _cond
+        self._listeners: List[Callable[[int], None]] = []
+        self._state = self._compute()
+        self.settings.subscribe(lambda _: self._publish())
+
+    @property
+    def weekly_windows(self) -> Dict[int, Tuple[Window, ...]]:
+        return dict(enumerate(self.settings.current().weekly_windows))
+
+    @property
+    def holidays(self) -> Dict[date, Tuple[Window, ...]]:
+        return dict(self.settings.current().holidays)
+
+    @property
+    def sensitivity_levels(self) -> Dict[str, int]:
+        snapshot = self.settings.current()
+        return {'day': snapshot.day_sensitivity, 'night': snapshot.night_sensitivity}
+
+    @property
+    def active_hours(self) -> Dict[str, dtime]:
+        """First monitoring window of today (kept for the single-window settings form)."""
+        windows = self.windows_for(date.today())
+        start, end = windows[0] if windows else (dtime(0, 0), dtime(0, 0))
+        return {'start': start, 'end': end}
+
+    def windows_for(self, day: date, snapshot: Optional[Settings] = None) -> Tuple[Window, ...]:
+        """Monitoring windows that start on `day`."""
+        snapshot = snapshot or self.settings.current()
+        if day in snapshot.holidays:
+            return snapshot.holidays[day]
+        return snapshot.weekly_windows[day.weekday()]
+
+    def _compute(self) -> ScheduleState:
+        """Work out the current state and when it next changes."""
+        snapshot = self.settings.current()
+        now = datetime.now()
+        monotonic_now = time.monotonic()
+
+        # Windows starting yesterday (overnight) through a week ahead
+        intervals = []
+        for offset in range(-1, 8):
+            day = now.date() + timedelta(days=offset)
+            for start, end in self.windows_for(day, snapshot):
+                begin = datetime.combine(day, start)
+                finish = datetime.combine(day, end) + timedelta(minutes=1)
+                if finish <= begin:
+                    finish += timedelta(days=1)
+                intervals.append((begin, finish))
+        monitoring = any(begin <= now < finish for begin, finish in intervals)
+
+        boundaries = [at for interval in intervals for at in interval if at > now]
+        day_start, night_start = snapshot.day_start, snapshot.night_start
+        for boundary in (day_start, night_start):
+            at = datetime.combine(now.date(), boundary)
+            boundaries.append(at if at > now else at + timedelta(days=1))
+        # Re-check at least hourly so wall clock adjustments are picked up
+        boundaries.append(now + timedelta(seconds=config.SCHEDULE_MAX_RECHECK))
+        next_at = min(boundaries)
+
+        if day_start <= night_start:
+            is_day = day_start <= now.time() < night_start
+        else:
+            is_day = not (night_start <= now.time() < day_start)
+        return ScheduleState(
+            version=snapshot.version,
+            monitoring=monitoring,
+            period='day' if is_day else 'night',
+            sensitivity=snapshot.day_sensitivity if is_day else snapshot.night_sensitivity,
+            next_transition=monotonic_now + (next_at - now).total_seconds(),
+            next_transition_at=next_at
+        )
+
+    def _publish(self):
+        """Recompute and swap in the state, then tell listeners about a new sensitivity."""
+        with self._cond:
+            previous = self._state
+            self._state = state = self._compute()
+            self._changes += 1
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        if previous.monitoring != state.monitoring:
+            logger.info(f"Monitoring {'started' if state.monitoring else 'paused'}; "
+                        f"next change at {state.next_transition_at:%Y-%m-%d %H:%M}")
+        if previous.sensitivity != state.sensitivity:
+            for listener in listeners:
+                listener(state.sensitivity)
+        return state
+
+    def current(self) -> ScheduleState:
+        """The state in effect now; recomputed only when a transition is due."""
+        state = self._state
+        if time.monotonic() >= state.next_transition:
+            state = self._publish()
+        return state
+
     def is_monitoring_time(self) -> bool:
         """Check if current time is within monitoring hours."""
-        current_time = datetime.now().time()
-        if self.active_hours['start'] <= self.active_hours['end']:
-            return self.active_hours['start'] <= current_time <= self.active_hours['end']
-        else:  # Handle overnight monitoring (e.g., 22:00 - 06:00)
-            return current_time >= self.active_hours['start'] or current_time <= self.active_hours['end']
-            
+        return self.current().monitoring
+
     def get_current_sensitivity(self) -> int:
         """Get motion sensitivity based on time of day."""
-        current_hour = datetime.now().hour
-        if 6 <= current_hour < 20:  # Daytime: 6 AM - 8 PM
-            return self.sensitivity_levels['day']
-        return self.sensitivity_levels['night']
-        
+        return self.current().sensitivity
+
+    def add_sensitivity_listener(self, listener: Callable[[int], None]):
+        """Call `listener(sensitivity)` now and whenever the sensitivity in effect changes."""
+        with self._cond:
+            self._listeners.append(listener)
+        listener(self.get_current_sensitivity())
+
+    def seconds_until_change(self) -> float:
+        """Seconds until the schedule state next changes."""
+        return max(0.0, self.current().next_transition - time.monotonic())
+
+    def wait_for_change(self, timeout: Optional[float] = None):
+        """Sleep until the next transition, a schedule change or `wake()`.
+
+        The change count is taken before the delay is worked out, so a change
+        or wake-up that lands in between ends the wait straight away.
+        """
+        with self._cond:
+            changes = self._changes
+        # Outside the lock: a due transition publishes and calls listeners
+        delay = self.seconds_until_change()
+        if timeout is not None:
+            delay = min(delay, timeout)
+        with self._cond:
+            self._cond.wait_for(lambda: self._changes != changes, delay)
+
+    def wake(self):
+        """Wake up every thread sleeping in `wait_for_change`."""
+        with self._cond:
+            self._changes += 1
+            self._cond.notify_all()
+
     def set_monitoring_hours(self, start_time: dtime, end_time: dtime):
-        """Set monitoring start and end times."""
-        self.active_hours['start'] = start_time
-        self.active_hours['end'] = end_time
+        """Use one monitoring window, from start to end, on every day of the week."""
+        self.settings.update({'weekly_windows': (((start_time, end_time),),) * 7})
         logger.info(f"Monitoring hours set to {start_time} - {end_time}")
-        
+
+    def set_windows(self, weekly_windows: Dict[int, List[Window]]):
+        """Replace the windows of the given weekdays (0 = Monday)."""
+        def merge(snapshot: Settings):
+            weekly = list(snapshot.weekly_windows)
+            for day, windows in weekly_windows.items():
+                weekly[day] = tuple(windows)
+            return {'weekly_windows': tuple(weekly)}
+        self.settings.update(merge)
+        logger.info(f"Monitoring windows updated for {', '.join(WEEKDAYS[day] for day in weekly_windows)}")
+
+    def set_holidays(self, holidays: Dict[date, List[Window]]):
+        """Replace the holiday overrides."""
+        self.settings.update({'holidays': MappingProxyType({day: tuple(windows)
+                                                            for day, windows in holidays.items()})})
+        logger.info(f"{len(holidays)} holiday overrides set")
+
     def set_sensitivity(self, day_level: int, night_level: int):
         """Set motion detection sensitivity levels."""
-        self.sensitivity_levels['day'] = day_level
-        self.sensitivity_levels['night'] = night_level
+        self.settings.update({'day_sensitivity': day_level, 'night_sensitivity': night_level})
         logger.info(f"Sensitivity levels set to: Day={day_level}, Night={night_level}")
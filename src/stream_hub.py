@@ -0,0 +1,246 @@
+import cv2
+import time
+import threading
+import logging
+from typing import Callable, Dict, Iterator, NamedTuple, Optional, Tuple
+import numpy as np
+from .capture import TimestampedFrame
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+BOUNDARY = b'frame'
+
+class Rendition(NamedTuple):
+    """One named substream of a camera (full, half, thumbnail...)."""
+    name: str
+    scale: float  # Fraction of the camera resolution
+    quality: Optional[int] = None  # JPEG quality (None = the stream_jpeg_quality setting)
+    max_fps: Optional[float] = None  # Encoded frames per second (None = the stream_max_fps setting)
+
+def parse_renditions(renditions: Dict[str, Tuple[float, Optional[int], Optional[float]]]) -> Dict[str, Rendition]:
+    """{name: (scale, quality, max_fps)} as in config.STREAM_RENDITIONS -> {name: Rendition}."""
+    parsed = {}
+    for name, (scale, quality, max_fps) in renditions.items():
+        if not 0 < scale <= 1:
+            raise ValueError(f"Stream {name}: scale must be in (0, 1], got {scale}")
+        parsed[name] = Rendition(name, float(scale), quality, max_fps)
+    return parsed
+
+class MJPEGBroadcaster:
+    """Encodes each frame once and fans the same JPEG bytes out to every viewer.
+
+    A single encoder thread pulls the newest frame from `source`, optionally
+    draws overlays on it, scales it by `scale`, JPEG-encodes it and
+    publishes the multipart chunk, at most `max_fps` times per second.
+    Subscribers always jump to the newest chunk, so a slow client skips
+    frames instead of building up a queue. Nothing is read or encoded while
+    nobody is watching.
+    """
+
+    def __init__(self, source: Callable[[], Optional[TimestampedFrame]], quality: int = 80,
+                 overlay: Optional[Callable[[np.ndarray], np.ndarray]] = None, name: str = "camera0",
+                 scale: float = 1.0, max_fps: Optional[float] = None, rendition: str = "full",
+                 on_demand: Optional[Callable[[bool], None]] = None):
+        self.source = source
+        # Called with True when the first viewer arrives and False when the last one leaves
+        self.on_demand = on_demand
+        self.name = name
+        self.rendition = rendition
+        self.quality = quality
+        self.scale = scale
+        self.max_fps = max_fps  # Read on every frame, so it can be changed while running
+        self.overlay = overlay
+        self.resolution: Optional[Tuple[int, int]] = None  # (width, height) of the last encoded frame
+        self._cond = threading.Condition()
+        self._chunk = None
+        self._jpeg = None
+        self._seq = 0
+        self._frame_time = 0.0  # Capture time (time.monotonic()) of the last encoded frame
+        self._snapshot_lock = threading.Lock()
+        self._subscribers = 0
+        self._running = False
+        self._thread = None
+        self._overlay_time = REGISTRY.histogram(
+            'stream_stage_seconds', "Time spent preparing stream frames", camera=name, stream=rendition,
+            stage='overlay'
+        )
+        self._resize_time = REGISTRY.histogram(
+            'stream_stage_seconds', "Time spent preparing stream frames", camera=name, stream=rendition,
+            stage='resize'
+        )
+        self._encode_time = REGISTRY.histogram(
+            'stream_stage_seconds', "Time spent preparing stream frames", camera=name, stream=rendition,
+            stage='jpeg_encode'
+        )
+        self._frames_encoded = REGISTRY.counter(
+            'stream_frames_encoded_total', "Frames encoded for a stream", camera=name, stream=rendition
+        )
+        self._frames_sent = REGISTRY.counter(
+            'stream_frames_sent_total', "Frames sent to stream viewers", camera=name, stream=rendition
+        )
+        self._frames_skipped = REGISTRY.counter(
+            'stream_frames_skipped_total', "Camera frames a viewer did not receive because it was behind",
+            camera=name, stream=rendition
+        )
+        REGISTRY.gauge('stream_subscribers', "Connected stream viewers",
+                       func=lambda: self._subscribers, camera=name, stream=rendition)
+
+    @property
+    def subscriber_count(self) -> int:
+        return self._subscribers
+
+    def start(self):
+        """Start the encoder thread."""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"MJPEGBroadcaster-{self.name}")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the encoder thread and end all subscriber streams."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(2.0)
+            self._thread = None
+
+    def _run(self):
+        next_due = 0.0
+        while self._running:
+            with self._cond:
+                self._cond.wait_for(lambda: self._subscribers > 0 or not self._running)
+                # Stay under max_fps; a stop request still ends the wait right away
+                delay = next_due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait_for(lambda: not self._running, delay)
+            if not self._running:
+                break
+
+            item = self.source()
+            if item is None:
+                time.sleep(0.1)
+                continue
+            if self.max_fps:
+                next_due = time.monotonic() + 1.0 / self.max_fps
+
+            self._encode(item)
+
+    def _encode(self, item: TimestampedFrame) -> bool:
+        """Overlay, scale and encode one frame and publish it to the subscribers."""
+        frame = item.frame
+        if self.overlay is not None:
+            # Overlays must draw on a copy; source frames are shared
+            with self._overlay_time.time():
+                frame = self.overlay(frame)
+        if self.scale < 1.0:
+            with self._resize_time.time():
+                height, width = frame.shape[:2]
+                size = (max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+        with self._encode_time.time():
+            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ret:
+            return False
+        self._frames_encoded.inc()
+
+        jpeg = buffer.tobytes()
+        chunk = (b'--' + BOUNDARY + b'\r\n'
+                 b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+        with self._cond:
+            self._jpeg = jpeg
+            self._chunk = chunk
+            self._seq = item.seq
+            self._frame_time = item.timestamp
+            self.resolution = (frame.shape[1], frame.shape[0])
+            self._cond.notify_all()
+        return True
+
+    def latest(self) -> Optional[Tuple[int, bytes]]:
+        """Return (seq, jpeg_bytes) of the most recently encoded frame."""
+        with self._cond:
+            if self._jpeg is None:
+                return None
+            return self._seq, self._jpeg
+
+    def snapshot(self, max_age: float = 1.0,
+                 timeout: float = 2.0) -> Optional[Tuple[int, bytes, float]]:
+        """Return (seq, jpeg_bytes, age) of a frame captured at most `max_age` seconds ago.
+
+        While someone watches the stream this is the encoder thread's last
+        frame. Otherwise the source is asked for frames (through
+        `on_demand`, so a paused capture runs meanwhile) until one is
+        recent enough, and it is encoded once for all callers that ask at
+        the same time. Returns None if no recent frame came within `timeout`.
+        """
+        with self._snapshot_lock:
+            with self._cond:
+                if self._jpeg is not None and time.monotonic() - self._frame_time <= max_age:
+                    return self._seq, self._jpeg, time.monotonic() - self._frame_time
+            if self.on_demand is not None:
+                self.on_demand(True)
+            try:
+                deadline = time.monotonic() + timeout
+                while time.monotonic() < deadline:
+                    item = self.source()
+                    if item is None:
+                        time.sleep(0.01)
+                        continue
+                    if time.monotonic() - item.timestamp > max_age:
+                        # Left over from before capture was paused; wait for a new one
+                        continue
+                    if not self._encode(item):
+                        return None
+                    with self._cond:
+                        return self._seq, self._jpeg, time.monotonic() - self._frame_time
+            finally:
+                if self.on_demand is not None:
+                    self.on_demand(False)
+            return None
+
+    def subscribe(self, max_fps: Optional[float] = None) -> Iterator[bytes]:
+        """Yield multipart MJPEG chunks, at most `max_fps` per second."""
+        min_interval = 1.0 / max_fps if max_fps else 0.0
+        last_seq = 0
+        next_send = 0.0
+
+        with self._cond:
+            self._subscribers += 1
+            first = self._subscribers == 1
+            self._cond.notify_all()
+        if first and self.on_demand is not None:
+            self.on_demand(True)
+        try:
+            while self._running:
+                if min_interval:
+                    delay = next_send - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                with self._cond:
+                    self._cond.wait_for(
+                        lambda: self._seq != last_seq or not self._running, timeout=1.0
+                    )
+                    if not self._running:
+                        break
+                    if self._seq == last_seq:
+                        continue
+                    # Always take the newest chunk; anything older is skipped
+                    if last_seq and self._seq > last_seq + 1:
+                        self._frames_skipped.inc(self._seq - last_seq - 1)
+                    last_seq = self._seq
+                    chunk = self._chunk
+
+                next_send = time.monotonic() + min_interval
+                self._frames_sent.inc()
+                yield chunk
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+                last = self._subscribers == 0
+            if last and self.on_demand is not None:
+                self.on_demand(False)
@@ -0,0 +1,255 @@
+import time
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from . import config
+from .camera import SecurityCamera
+from .face_detector import FaceDetector
+from .detection import FACE
+from .event_recorder import CapturedFrame, DetectionEvent, EventRecorder
+from .metrics import REGISTRY
+from .rate_control import AdaptiveRateController
+from .tracker import MotionTracker
+from .runtime_config import RuntimeConfig, get_runtime_config
+
+logger = logging.getLogger(__name__)
+
+def motion_score(motion_boxes, frame) -> float:
+    """Fraction of the frame covered by motion boxes."""
+    frame_area = frame.shape[0] * frame.shape[1]
+    return min(1.0, sum(w * h for (_, _, w, h) in motion_boxes) / frame_area)
+
+class CameraPipeline:
+    """Capture, motion and face detection and event recording for one camera.
+
+    `run` processes frames on the calling thread until told to stop or the
+    source runs dry. Frames are analysed at a low rate while the scene is
+    quiet and at full rate from the first motion on. Frames are never
+    drawn on: each one travels with a DetectionResult, and outputs that
+    want boxes render them themselves. The newest frame and its detections
+    are kept for display, and frame rate and CPU time spent on this
+    camera are tracked. Runtime settings are read once per frame from the
+    current snapshot, so a change applies from the next frame on.
+    """
+
+    def __init__(self, name: str, source, on_event: Callable[[DetectionEvent], None],
+                 face_pool=None, settings: Optional[RuntimeConfig] = None):
+        self.name = name
+        self.settings = settings or get_runtime_config()
+        self.camera = SecurityCamera(max_retries=5, source=source, name=name)
+        frame_bus = None
+        if face_pool is not None and self.camera.frame_bus is not None:
+            # Face workers read frames from shared memory instead of receiving pickled crops
+            frame_bus = (self.camera.frame_bus.name, self.camera.frame_bus.add_consumer('faces'))
+        self.face_detector = FaceDetector(pool=face_pool, channel=name, frame_bus=frame_bus)
+        self.tracker = MotionTracker(camera=name)
+        clip_dir = config.CLIP_STAGING_DIR if config.EVENT_RECORDING_MODE == "clip" else None
+        self.recorder = EventRecorder(on_event=on_event, camera=name, clip_dir=clip_dir,
+                                      tracker=self.tracker)
+        snapshot = self.settings.current()
+        self.rate = AdaptiveRateController(snapshot.analysis_idle_fps, snapshot.camera_max_fps,
+                                           snapshot.analysis_active_hold)
+        self._settings_version = snapshot.version
+        self.motion_detected = False
+        self._lock = threading.Lock()
+        self._latest: Optional[CapturedFrame] = None
+        self.frames = 0
+        self.fps = 0.0
+        self.cpu_percent = 0.0
+        self._last_frame_time = None
+        self._cpu_window_start: Optional[Tuple[float, float]] = None
+        self._last_seq = 0
+        self.alive = True
+        self._frames_processed = REGISTRY.counter(
+            'pipeline_frames_total', "Frames processed by a camera pipeline", camera=name
+        )
+        self._frames_dropped = REGISTRY.counter(
+            'pipeline_frames_dropped_total', "Captured frames a camera pipeline skipped because it was behind",
+            camera=name
+        )
+        REGISTRY.gauge('pipeline_fps', "Frames per second processed by a camera pipeline",
+                       func=lambda: self.fps, camera=name)
+        REGISTRY.gauge('pipeline_cpu_percent', "CPU used by a camera pipeline (percent of one core)",
+                       func=lambda: self.cpu_percent, camera=name)
+
+    def latest(self) -> Optional[CapturedFrame]:
+        """Newest processed frame (clean) with its detections, or None before the first one."""
+        with self._lock:
+            return self._latest
+
+    def process(self) -> bool:
+        """Process the next frame. Returns False when the source has no more frames."""
+        snapshot = self.settings.current()
+        if snapshot.version != self._settings_version:
+            self.rate.configure(snapshot.analysis_idle_fps, snapshot.camera_max_fps,
+                                snapshot.analysis_active_hold)
+            self._settings_version = snapshot.version
+        item = self.camera.read_latest()
+        if item is None:
+            return False
+        frame = item.frame
+        if self._last_seq and item.seq > self._last_seq + 1:
+            self._frames_dropped.inc(item.seq - self._last_seq - 1)
+        self._last_seq = item.seq
+
+        result = self.camera.process_frame(
+            frame, inactivity_timeout=snapshot.inactivity_timeout, seq=item.seq, timestamp=item.timestamp
+        )
+        self.motion_detected = result.motion_detected
+        self.tracker.update(self.camera.last_motion_boxes, item.timestamp)
+        if snapshot.face_detection_enabled:
+            result.add(self.face_detector.detect_faces(
+                frame, self.camera.last_motion_boxes, gated=snapshot.face_motion_gated,
+                frame_seq=item.seq
+            ), FACE)
+
+        if result.should_capture and self.recorder.trigger(
+                timestamp=item.timestamp,
+                motion_score=motion_score(self.camera.last_motion_boxes, frame)):
+            logger.info(f"Motion detected on {self.name}! Recording {config.TOTAL_CAPTURES} images...")
+        self.recorder.feed(frame, result, timestamp=item.timestamp)
+
+        with self._lock:
+            self._latest = CapturedFrame(item.timestamp, frame, result)
+        self._update_stats()
+        return True
+
+    def _update_stats(self):
+        now = time.monotonic()
+        if self._last_frame_time is not None:
+            elapsed = now - self._last_frame_time
+            if elapsed > 0:
+                self.fps += (1.0 / elapsed - self.fps) * 0.1
+        self._last_frame_time = now
+        self.frames += 1
+        self._frames_processed.inc()
+
+        # CPU share of this pipeline thread and its frame grabber over roughly the last second
+        cpu = time.thread_time()
+        if self.camera.grabber is not None:
+            cpu += self.camera.grabber.cpu_seconds
+        if self._cpu_window_start is None:
+            self._cpu_window_start = (now, cpu)
+        elif now - self._cpu_window_start[0] >= 1.0:
+            start_wall, start_cpu = self._cpu_window_start
+            self.cpu_percent = 100.0 * (cpu - start_cpu) / (now - start_wall)
+            self._cpu_window_start = (now, cpu)
+
+    def run(self, stop_event: threading.Event, scheduler=None):
+        """Process frames until `stop_event` is set or the source fails."""
+        try:
+            while not stop_event.is_set():
+                if scheduler is not None and not scheduler.is_monitoring_time():
+                    # Stop decoding frames nobody analyses (stream viewers still get them)
+                    # and sleep until the next monitoring window opens or the schedule changes
+                    self.camera.pause_capture()
+                    scheduler.wait_for_change()
+                    continue
+                self.camera.resume_capture()
+                started = time.monotonic()
+                if not self.process():
+                    logger.error(f"Camera {self.name}: failed to read frame, stopping pipeline")
+                    break
+                interval = self.rate.update(self.motion_detected or self.recorder.recording, started)
+                remaining = interval - (time.monotonic() - started)
+                if remaining > 0:
+                    stop_event.wait(remaining)
+        except Exception as e:
+            logger.error(f"Camera {self.name}: pipeline failed: {str(e)}")
+        finally:
+            self.alive = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'source': str(self.camera.source),
+            'alive': self.alive,
+            'frames': self.frames,
+            'fps': round(self.fps, 1),
+            'cpu_percent': round(self.cpu_percent, 1),
+            'cpu_budget': config.CAMERA_CPU_BUDGET,
+            'analysis_rate': 'active' if self.rate.active else 'idle',
+            'tracked_objects': len(self.tracker.tracks),
+            'monitoring': self.camera.monitoring_active,
+            'frame_bus': self.camera.frame_bus.consumers() if self.camera.frame_bus is not None else None,
+        }
+
+    def set_sensitivity(self, min_area: int):
+        """Apply a new minimum motion area; picked up from the next frame on."""
+        self.camera.motion_engine.min_area = min_area
+
+    def release(self):
+        self.camera.release()
+
+class CameraSupervisor:
+    """Runs one CameraPipeline per source, each on its own thread.
+
+    All pipelines report events through the same `on_event` callback, so
+    storage and notifications are shared. A camera that cannot be opened
+    is skipped; startup only fails if none of them can.
+    """
+
+    def __init__(self, sources: Dict[str, Any], on_event: Callable[[DetectionEvent], None],
+                 scheduler=None, face_pool=None, settings: Optional[RuntimeConfig] = None,
+                 stats_interval: float = config.CAMERA_STATS_INTERVAL):
+        self.scheduler = scheduler
+        self.stats_interval = stats_interval
+        self.pipelines: Dict[str, CameraPipeline] = {}
+        for name, source in sources.items():
+            try:
+                self.pipelines[name] = CameraPipeline(name, source, on_event, face_pool=face_pool,
+                                                     settings=settings)
+            except Exception as e:
+                logger.error(f"Camera {name} ({source}) could not be started: {str(e)}")
+        if not self.pipelines:
+            raise Exception("No cameras could be started")
+        if scheduler is not None:
+            # Day/night sensitivity drives each motion engine's minimum contour area
+            for pipeline in self.pipelines.values():
+                scheduler.add_sensitivity_listener(pipeline.set_sensitivity)
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def cameras(self) -> Dict[str, SecurityCamera]:
+        return {name: pipeline.camera for name, pipeline in self.pipelines.items()}
+
+    @property
+    def running(self) -> bool:
+        """True while at least one pipeline is still processing frames."""
+        return any(pipeline.alive for pipeline in self.pipelines.values())
+
+    def start(self):
+        """Start one thread per pipeline, plus the stats reporter."""
+        for name, pipeline in self.pipelines.items():
+            thread = threading.Thread(target=pipeline.run, args=(self._stop, self.scheduler),
+                                      name=f"Pipeline-{name}")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        reporter = threading.Thread(target=self._report_loop, name="SupervisorStats")
+        reporter.daemon = True
+        reporter.start()
+        logger.info(f"Started {len(self.pipelines)} camera pipelines: {', '.join(self.pipelines)}")
+
+    def stop(self, timeout: float = 5.0):
+        """Stop every pipeline and release its camera."""
+        self._stop.set()
+        if self.scheduler is not None:
+            self.scheduler.wake()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        for pipeline in self.pipelines.values():
+            pipeline.release()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-camera frame rate and CPU usage."""
+        return {name: pipeline.stats() for name, pipeline in self.pipelines.items()}
+
+    def _report_loop(self):
+        while not self._stop.wait(self.stats_interval):
+            for name, stats in self.stats().items():
+                logger.info(f"Camera {name}: {stats['fps']} fps, {stats['cpu_percent']}% CPU, "
+                            f"{stats['frames']} frames")
+                if stats['cpu_percent'] > config.CAMERA_CPU_BUDGET:
+                    logger.warning(f"Camera {name} is over its CPU budget "
+                                   f"({stats['cpu_percent']}% > {config.CAMERA_CPU_BUDGET}%)")
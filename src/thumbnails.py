@@ -0,0 +1,69 @@
+import cv2
+import uuid
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from . import config
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+class ThumbnailCache:
+    """Least-recently-used cache of small JPEG previews of stored event frames.
+
+    Stored frames never change, so a cached thumbnail stays valid until it
+    is evicted, and its ETag follows from the event, frame and width without
+    touching the file. The ETag also carries a per-process token, because
+    event ids start over when the event database is recreated.
+    """
+
+    def __init__(self, store, width: int = config.THUMBNAIL_WIDTH,
+                 quality: int = config.THUMBNAIL_JPEG_QUALITY,
+                 max_entries: int = config.THUMBNAIL_CACHE_SIZE):
+        self.store = store
+        self.width = width
+        self.quality = quality
+        self.max_entries = max(1, max_entries)
+        self._cache: "OrderedDict[Tuple[int, int], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._token = uuid.uuid4().hex[:12]
+        self._hits = REGISTRY.counter('thumbnail_cache_requests_total', "Event thumbnail lookups",
+                                      result='hit')
+        self._misses = REGISTRY.counter('thumbnail_cache_requests_total', "Event thumbnail lookups",
+                                        result='miss')
+        REGISTRY.gauge('thumbnail_cache_entries', "Event thumbnails held in memory",
+                       func=lambda: len(self._cache))
+
+    def etag(self, event_id: int, index: int) -> str:
+        return f"event-{event_id}-{index}-{self.width}-{self._token}"
+
+    def get(self, event: Dict[str, Any], index: int) -> Optional[bytes]:
+        """JPEG thumbnail of the `index`-th (1-based) frame of a stored event, or None if it has none."""
+        key = (event['id'], index)
+        with self._lock:
+            thumbnail = self._cache.get(key)
+            if thumbnail is not None:
+                self._cache.move_to_end(key)
+                self._hits.inc()
+                return thumbnail
+        self._misses.inc()
+
+        frame = cv2.imread(self.store.frame_path(event, index))
+        if frame is None:
+            return None
+        height, width = frame.shape[:2]
+        if width > self.width:
+            size = (self.width, max(1, round(height * self.width / width)))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ret:
+            logger.error(f"Could not encode a thumbnail of event {event['id']} frame {index}")
+            return None
+
+        thumbnail = buffer.tobytes()
+        with self._lock:
+            self._cache[key] = thumbnail
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return thumbnail
@@ -0,0 +1,185 @@
+import time
+import itertools
+import logging
+from collections import deque
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from . import config
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+Box = Tuple[int, int, int, int]
+
+def estimate_direction(dx: float, dy: float, min_displacement: float = 0.0) -> Optional[str]:
+    """Dominant direction of a displacement, or None if it is shorter than `min_displacement`."""
+    if np.hypot(dx, dy) < max(min_displacement, 1e-9):
+        return None
+    if abs(dx) > abs(dy):
+        return "right" if dx > 0 else "left"
+    return "down" if dy > 0 else "up"
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Intersection over union of every (x, y, w, h) box in `a` with every box in `b`."""
+    ax0, ay0 = a[:, 0:1], a[:, 1:2]
+    ax1, ay1 = ax0 + a[:, 2:3], ay0 + a[:, 3:4]
+    bx0, by0 = b[:, 0], b[:, 1]
+    bx1, by1 = bx0 + b[:, 2], by0 + b[:, 3]
+    inter = (np.clip(np.minimum(ax1, bx1) - np.maximum(ax0, bx0), 0, None) *
+             np.clip(np.minimum(ay1, by1) - np.maximum(ay0, by0), 0, None))
+    union = a[:, 2:3] * a[:, 3:4] + b[:, 2] * b[:, 3] - inter
+    return inter / np.maximum(union, 1e-9)
+
+class TrackSummary(NamedTuple):
+    """What one tracked object did while it was visible."""
+    track_id: int
+    first_seen: float  # time.monotonic()
+    last_seen: float
+    dwell_time: float  # Seconds between the first and last sighting
+    distance: float  # Path length in pixels
+    speed: float  # Average speed in pixels per second
+    direction: Optional[str]  # Dominant direction of the net movement
+    start: Tuple[int, int]  # First and last centroid
+    end: Tuple[int, int]
+
+class Track:
+    """One object followed across frames."""
+
+    __slots__ = ('track_id', 'box', 'velocity', 'first_seen', 'last_seen', 'trajectory', 'distance')
+
+    def __init__(self, track_id: int, box: np.ndarray, timestamp: float, history: int):
+        self.track_id = track_id
+        self.box = box
+        self.velocity = np.zeros(2)  # Centroid pixels per second
+        self.first_seen = self.last_seen = timestamp
+        self.trajectory = deque([(timestamp, *self.centroid)], maxlen=history)
+        self.distance = 0.0
+
+    @property
+    def centroid(self) -> np.ndarray:
+        return self.box[:2] + self.box[2:] / 2
+
+    def update(self, box: np.ndarray, timestamp: float):
+        previous = self.centroid
+        self.box = box
+        centroid = self.centroid
+        dt = timestamp - self.last_seen
+        if dt > 0:
+            # Smoothed so one ragged contour does not throw off the prediction
+            self.velocity += ((centroid - previous) / dt - self.velocity) * 0.5
+        self.distance += float(np.hypot(*(centroid - previous)))
+        self.last_seen = timestamp
+        self.trajectory.append((timestamp, *centroid))
+
+    def summary(self, min_displacement: float = config.TRACKER_MIN_DISPLACEMENT) -> TrackSummary:
+        _, x0, y0 = self.trajectory[0]
+        _, x1, y1 = self.trajectory[-1]
+        dwell_time = self.last_seen - self.first_seen
+        return TrackSummary(
+            track_id=self.track_id,
+            first_seen=self.first_seen,
+            last_seen=self.last_seen,
+            dwell_time=dwell_time,
+            distance=self.distance,
+            speed=self.distance / dwell_time if dwell_time > 0 else 0.0,
+            direction=estimate_direction(x1 - x0, y1 - y0, min_displacement),
+            start=(int(x0), int(y0)),
+            end=(int(x1), int(y1)),
+        )
+
+class MotionTracker:
+    """Follows every motion box from frame to frame.
+
+    Each update matches the new boxes to the existing tracks in one pass
+    over vectorised centroid-distance and IoU matrices: a box continues a
+    track if it overlaps the track's last box, or if its centroid is close
+    to where the track's velocity predicts it (the gate widens with the
+    time since the track was last seen). Pairs are taken cheapest first.
+    Unmatched boxes start new tracks; tracks not seen for `max_age`
+    seconds end, and the most recent ended tracks are kept so events can
+    still summarise them.
+    """
+
+    def __init__(self, iou_threshold: float = config.TRACKER_IOU_THRESHOLD,
+                 min_distance: float = config.TRACKER_MIN_DISTANCE,
+                 max_speed: float = config.TRACKER_MAX_SPEED,
+                 max_age: float = config.TRACKER_MAX_AGE,
+                 history: int = config.TRACKER_HISTORY,
+                 finished_keep: int = config.TRACKER_FINISHED_KEEP,
+                 camera: str = "default"):
+        self.iou_threshold = iou_threshold
+        self.min_distance = min_distance
+        self.max_speed = max_speed
+        self.max_age = max_age
+        self.history = history
+        self.tracks: List[Track] = []
+        self._finished = deque(maxlen=finished_keep)
+        self._ids = itertools.count(1)
+        self._update_time = REGISTRY.histogram(
+            'pipeline_stage_seconds', "Time spent in each pipeline stage", camera=camera, stage='tracking'
+        )
+        REGISTRY.gauge('tracked_objects', "Objects currently tracked", func=lambda: len(self.tracks),
+                       camera=camera)
+
+    def update(self, boxes: Sequence[Box], timestamp: Optional[float] = None) -> List[Track]:
+        """Match this frame's motion boxes to the tracks and return the live tracks."""
+        with self._update_time.time():
+            return self._update(boxes, time.monotonic() if timestamp is None else timestamp)
+
+    def _update(self, boxes: Sequence[Box], now: float) -> List[Track]:
+        detections = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        matched_tracks, matched_boxes = self._match(detections, now)
+
+        for ti, di in zip(matched_tracks, matched_boxes):
+            self.tracks[ti].update(detections[di], now)
+        unmatched = np.ones(len(detections), bool)
+        unmatched[matched_boxes] = False
+        live = []
+        for track in self.tracks:
+            if now - track.last_seen > self.max_age:
+                self._finished.append(track.summary())
+            else:
+                live.append(track)
+        for di in np.flatnonzero(unmatched):
+            live.append(Track(next(self._ids), detections[di], now, self.history))
+        self.tracks = live
+        return live
+
+    def _match(self, detections: np.ndarray, now: float) -> Tuple[List[int], List[int]]:
+        """Indexes of matched (track, box) pairs, cheapest pairs first."""
+        if not self.tracks or not len(detections):
+            return [], []
+        track_boxes = np.array([track.box for track in self.tracks])
+        elapsed = now - np.array([track.last_seen for track in self.tracks])
+        velocity = np.array([track.velocity for track in self.tracks])
+        predicted = track_boxes[:, :2] + track_boxes[:, 2:] / 2 + velocity * elapsed[:, None]
+        centroids = detections[:, :2] + detections[:, 2:] / 2
+
+        distance = np.linalg.norm(predicted[:, None, :] - centroids[None, :, :], axis=2)
+        overlap = iou_matrix(track_boxes, detections)
+        gate = np.maximum(self.min_distance, self.max_speed * elapsed)[:, None]
+        cost = distance / gate - overlap
+        cost[(overlap < self.iou_threshold) & (distance > gate)] = np.inf
+
+        order = np.argsort(cost, axis=None)
+        order = order[np.isfinite(cost.ravel()[order])]
+        track_used = np.zeros(len(self.tracks), bool)
+        box_used = np.zeros(len(detections), bool)
+        matched_tracks, matched_boxes = [], []
+        for ti, di in zip(*np.unravel_index(order, cost.shape)):
+            if track_used[ti] or box_used[di]:
+                continue
+            track_used[ti] = box_used[di] = True
+            matched_tracks.append(int(ti))
+            matched_boxes.append(int(di))
+        return matched_tracks, matched_boxes
+
+    def summaries(self, since: float = 0.0) -> List[TrackSummary]:
+        """Tracks (live and recently ended) seen at or after `since`, longest path first."""
+        summaries = [summary for summary in self._finished if summary.last_seen >= since]
+        summaries += [track.summary() for track in self.tracks if track.last_seen >= since]
+        return sorted(summaries, key=lambda summary: summary.distance, reverse=True)
+
+    def reset(self):
+        self.tracks = []
+        self._finished.clear()
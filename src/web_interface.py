@@ -1,71 +1,274 @@
-from flask import Flask, render_template, Response, jsonify, request
-import cv2
+from flask import Flask, render_template, Response, jsonify, request, url_for
 import threading
 import logging
-from datetime import datetime, time
+from datetime import date, time as dtime
 import os
+import uuid
+from functools import partial
+from . import config
+from .stream_hub import MJPEGBroadcaster, BOUNDARY, parse_renditions
+from .thumbnails import ThumbnailCache
+from .metrics import REGISTRY
+from .runtime_config import WEEKDAYS, VersionConflict, from_json, parse_time, parse_windows, to_json
 
 logger = logging.getLogger(__name__)
 
+def settings_changes(data, snapshot):
+    """Typed runtime config changes for a settings POST, based on `snapshot`.
+
+    Accepts the settings form keys (monitoring_hours, windows, sensitivity)
+    as well as any runtime config field by name.
+    """
+    data = dict(data)
+    data.pop('version', None)
+    changes = {}
+    if 'monitoring_hours' in data:
+        hours = data.pop('monitoring_hours')
+        window = (parse_time(hours['start']), parse_time(hours['end']))
+        changes['weekly_windows'] = ((window,),) * 7
+    if 'windows' in data:
+        weekly = list(changes.get('weekly_windows', snapshot.weekly_windows))
+        for day, windows in data.pop('windows').items():
+            weekly[WEEKDAYS.index(day)] = parse_windows(windows)
+        changes['weekly_windows'] = tuple(weekly)
+    if 'sensitivity' in data:
+        sensitivity = data.pop('sensitivity')
+        changes['day_sensitivity'] = int(sensitivity['day'])
+        changes['night_sensitivity'] = int(sensitivity['night'])
+    changes.update(from_json(data, snapshot._replace(**changes)))
+    return changes
+
 class WebInterface:
-    def __init__(self, camera, scheduler):
+    def __init__(self, cameras, scheduler, overlay=None, camera_stats=None, event_store=None):
+        """`cameras` is a single camera or a {name: camera} dict; the first one is the default stream.
+
+        With an `event_store` the stored events can be browsed through /api/events.
+        """
         # Get the directory containing web_interface.py
         template_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'templates'))
         self.app = Flask(__name__, template_folder=template_dir)
-        self.camera = camera
+        if not isinstance(cameras, dict):
+            cameras = {getattr(cameras, 'name', 'camera0'): cameras}
+        self.cameras = cameras
+        self.camera = next(iter(cameras.values()))
         self.scheduler = scheduler
+        self.runtime_config = scheduler.settings
+        self.camera_stats = camera_stats
+        self.event_store = event_store
+        self.thumbnails = ThumbnailCache(event_store) if event_store is not None else None
+        # One broadcaster per camera and rendition; each only encodes while it has viewers,
+        # and keeps its camera capturing while it has them, even outside monitoring hours
+        self.renditions = parse_renditions(config.STREAM_RENDITIONS)
+        self.default_rendition = config.STREAM_DEFAULT_RENDITION
+        if self.default_rendition not in self.renditions:
+            raise ValueError(f"Unknown default stream {self.default_rendition}")
+        self.hubs = {
+            name: {
+                rendition.name: MJPEGBroadcaster(
+                    camera.read_latest, overlay=overlay, name=name, scale=rendition.scale,
+                    rendition=rendition.name, on_demand=partial(camera.want_frames, f"stream-{rendition.name}")
+                )
+                for rendition in self.renditions.values()
+            }
+            for name, camera in cameras.items()
+        }
+        self.default_camera = next(iter(cameras))
+        # Frame sequence numbers restart with the process, so snapshot ETags also carry this
+        self._snapshot_token = uuid.uuid4().hex[:12]
+        self._apply_stream_settings(self.runtime_config.current())
+        self.runtime_config.subscribe(self._apply_stream_settings)
         
         # Register routes
         self.app.route('/')(self.index)
         self.app.route('/video_feed')(self.video_feed)
+        self.app.route('/api/cameras')(self.list_cameras)
+        self.app.route('/api/streams')(self.list_streams)
+        self.app.route('/api/snapshot')(self.snapshot)
+        self.app.route('/api/events')(self.list_events)
+        self.app.route('/api/events/<int:event_id>/thumbnail')(self.event_thumbnail)
+        self.app.route('/metrics')(self.metrics)
         self.app.route('/api/settings', methods=['GET', 'POST'])(self.settings)
         
     def index(self):
         """Render main page."""
-        return render_template('index.html')
+        return render_template('index.html', cameras=list(self.cameras), streams=list(self.renditions),
+                               default_stream=self.default_rendition)
         
-    def gen_frames(self):
-        """Generate camera frames."""
-        while True:
-            success, frame = self.camera.read_frame()
-            if not success:
-                break
-            else:
-                ret, buffer = cv2.imencode('.jpg', frame)
-                if not ret:
-                    continue
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+    def _stream_fps(self, rendition, snapshot) -> float:
+        """Frame rate of a rendition; stream_max_fps caps every one of them."""
+        if rendition.max_fps is None:
+            return snapshot.stream_max_fps
+        return min(rendition.max_fps, snapshot.stream_max_fps)
+
+    def _apply_stream_settings(self, snapshot):
+        """Encoders read quality and rate on every frame, so new viewers and old ones switch together."""
+        for hubs in self.hubs.values():
+            for name, hub in hubs.items():
+                rendition = self.renditions[name]
+                hub.quality = snapshot.stream_jpeg_quality if rendition.quality is None else rendition.quality
+                hub.max_fps = self._stream_fps(rendition, snapshot)
+
+    def gen_frames(self, max_fps=None, camera=None, stream=None):
+        """Generate frames of one rendition of `camera` from its shared broadcast hub."""
+        hub = self.hubs[camera or self.default_camera][stream or self.default_rendition]
+        return hub.subscribe(max_fps=max_fps or hub.max_fps)
                        
     def video_feed(self):
-        """Video streaming route."""
-        return Response(self.gen_frames(),
-                       mimetype='multipart/x-mixed-replace; boundary=frame')
+        """Video streaming route; ?stream= picks the rendition and ?fps= lowers its rate."""
+        camera = request.args.get('camera', self.default_camera)
+        if camera not in self.hubs:
+            return jsonify({'error': f'unknown camera {camera}'}), 404
+        stream = request.args.get('stream', self.default_rendition)
+        if stream not in self.renditions:
+            return jsonify({'error': f'unknown stream {stream}', 'streams': list(self.renditions)}), 404
+        max_fps = request.args.get('fps', type=float)
+        if max_fps is not None:
+            stream_fps = self._stream_fps(self.renditions[stream], self.runtime_config.current())
+            max_fps = max(0.1, min(max_fps, stream_fps))
+        return Response(self.gen_frames(max_fps, camera, stream),
+                       mimetype='multipart/x-mixed-replace; boundary=' + BOUNDARY.decode())
+                       
+    def list_streams(self):
+        """Renditions offered for every camera, with their current settings and viewers."""
+        hubs = self.hubs[self.default_camera]
+        streams = {}
+        for name, rendition in self.renditions.items():
+            streams[name] = {
+                'scale': rendition.scale,
+                'quality': hubs[name].quality,
+                'max_fps': hubs[name].max_fps,
+                'viewers': {camera: self.hubs[camera][name].subscriber_count for camera in self.hubs},
+            }
+        return jsonify({'default': self.default_rendition, 'streams': streams})
                        
+    def snapshot(self):
+        """Newest frame of a camera as one JPEG, served from the stream encoder's memory.
+
+        Takes the same ?camera= and ?stream= as /video_feed. The ETag
+        changes with every new frame and with every restart, so a poller
+        that sends If-None-Match gets a bodiless 304 until there is one.
+        Outside monitoring hours capture runs just long enough to take a
+        new frame; X-Frame-Age says how old the frame is, in seconds.
+        """
+        camera = request.args.get('camera', self.default_camera)
+        if camera not in self.hubs:
+            return jsonify({'error': f'unknown camera {camera}'}), 404
+        stream = request.args.get('stream', self.default_rendition)
+        if stream not in self.renditions:
+            return jsonify({'error': f'unknown stream {stream}', 'streams': list(self.renditions)}), 404
+        latest = self.hubs[camera][stream].snapshot(config.SNAPSHOT_MAX_AGE, config.FRAME_READ_TIMEOUT)
+        if latest is None:
+            return jsonify({'error': f'no current frame from camera {camera}'}), 503
+        seq, jpeg, age = latest
+        response = self._cached_response(jpeg, 'image/jpeg', f"{camera}-{stream}-{self._snapshot_token}-{seq}")
+        response.headers['X-Frame-Age'] = f"{age:.3f}"
+        return response
+
+    def list_events(self):
+        """Stored events, newest first.
+
+        ?limit= sets the page size, ?before= (a Unix time) and ?offset=
+        pick the page, ?camera= filters. `next` links the following page.
+        """
+        if self.event_store is None:
+            return jsonify({'error': 'event storage is not enabled'}), 503
+        try:
+            limit = max(1, min(int(request.args.get('limit', config.EVENTS_PAGE_SIZE)),
+                               config.EVENTS_MAX_PAGE_SIZE))
+            offset = max(0, int(request.args.get('offset', 0)))
+            before = request.args.get('before')
+            before = float(before) if before is not None else None
+        except ValueError as e:
+            return jsonify({'error': f"Invalid page: {str(e)}"}), 400
+        camera = request.args.get('camera')
+        events = self.event_store.list_events(limit, offset, before=before, camera=camera)
+        for event in events:
+            event['thumbnail'] = url_for('event_thumbnail', event_id=event['id'])
+        next_page = None
+        if len(events) == limit:
+            # Continue from the oldest event listed; unlike an offset this survives new events
+            next_page = url_for('list_events', limit=limit, before=events[-1]['started_at'], camera=camera)
+        response = jsonify({'events': events, 'limit': limit, 'next': next_page})
+        response.add_etag()
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+    def event_thumbnail(self, event_id):
+        """Small JPEG of a stored event frame (?frame=, 1-based; default the middle one)."""
+        if self.event_store is None:
+            return jsonify({'error': 'event storage is not enabled'}), 503
+        event = self.event_store.get_event(event_id)
+        if event is None or not event['frame_count']:
+            return jsonify({'error': f'unknown event {event_id}'}), 404
+        index = request.args.get('frame', (event['frame_count'] + 1) // 2, type=int)
+        if not 1 <= index <= event['frame_count']:
+            return jsonify({'error': f"event {event_id} has frames 1 to {event['frame_count']}"}), 404
+        etag = self.thumbnails.etag(event_id, index)
+        if etag in request.if_none_match:
+            # Stored frames never change, so a matching tag needs no lookup at all
+            return self._cached_response(b'', 'image/jpeg', etag)
+        thumbnail = self.thumbnails.get(event, index)
+        if thumbnail is None:
+            return jsonify({'error': f'frame {index} of event {event_id} is missing'}), 404
+        return self._cached_response(thumbnail, 'image/jpeg', etag)
+
+    def _cached_response(self, body, mimetype, etag):
+        """Response tagged with `etag`; a 304 without body if the client already has it."""
+        response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+    def list_cameras(self):
+        """Camera names with their frame rate and CPU usage."""
+        stats = self.camera_stats() if self.camera_stats else {}
+        return jsonify({name: stats.get(name, {}) for name in self.cameras})
+                       
+    def metrics(self):
+        """Prometheus scrape endpoint."""
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+        
     def settings(self):
-        """Handle settings API."""
+        """Handle settings API.
+
+        A POST is applied as one new runtime config version, or not at all.
+        If it carries the `version` it was based on and the settings have
+        changed since, it is rejected with 409.
+        """
         if request.method == 'GET':
-            return jsonify({
-                'monitoring_hours': {
-                    'start': self.scheduler.active_hours['start'].strftime('%H:%M'),
-                    'end': self.scheduler.active_hours['end'].strftime('%H:%M')
-                },
-                'sensitivity': self.scheduler.sensitivity_levels
+            snapshot = self.runtime_config.current()
+            state = self.scheduler.current()
+            today = self.scheduler.windows_for(date.today(), snapshot)
+            start, end = today[0] if today else (dtime(0, 0), dtime(0, 0))
+            data = to_json(snapshot)
+            data.update({
+                'monitoring_hours': {'start': start.strftime('%H:%M'), 'end': end.strftime('%H:%M')},
+                'windows': data['weekly_windows'],
+                'sensitivity': {'day': snapshot.day_sensitivity, 'night': snapshot.night_sensitivity},
+                'current': {
+                    'monitoring': state.monitoring,
+                    'period': state.period,
+                    'sensitivity': state.sensitivity,
+                    'next_change': state.next_transition_at.isoformat(timespec='minutes')
+                }
             })
+            return jsonify(data)
             
-        data = request.json
-        if 'monitoring_hours' in data:
-            start = datetime.strptime(data['monitoring_hours']['start'], '%H:%M').time()
-            end = datetime.strptime(data['monitoring_hours']['end'], '%H:%M').time()
-            self.scheduler.set_monitoring_hours(start, end)
-            
-        if 'sensitivity' in data:
-            self.scheduler.set_sensitivity(
-                data['sensitivity']['day'],
-                data['sensitivity']['night']
-            )
+        data = request.json or {}
+        try:
+            expected_version = data.get('version')
+            if expected_version is not None:
+                expected_version = int(expected_version)
+            # Changes are built from the snapshot they replace, under the writer lock
+            snapshot = self.runtime_config.update(lambda current: settings_changes(data, current),
+                                                  expected_version=expected_version)
+        except VersionConflict as e:
+            return jsonify({'status': 'conflict', 'message': str(e),
+                            'version': self.runtime_config.version}), 409
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            return jsonify({'status': 'error', 'message': f"Invalid settings: {str(e)}"}), 400
             
-        return jsonify({'status': 'success'})
+        return jsonify({'status': 'success', 'version': snapshot.version})
         
     def run(self, host='0.0.0.0', port=5000):
         """Run the web interface."""
@@ -143,9 +346,22 @@ class WebInterface:
     <div class="container">
         <h1>Security Camera Monitor</h1>
         
+        <div class="form-group">
+            <label>Stream</label>
+            <select id="stream" onchange="setStream(this.value)">
+                {% for stream in streams %}
+                <option value="{{ stream }}" {% if stream == default_stream %}selected{% endif %}>{{ stream }}</option>
+                {% endfor %}
+            </select>
+        </div>
+        
+        {% for camera in cameras %}
         <div class="video-container">
-            <img src="{{ url_for('video_feed') }}" width="100%">
+            <h3>{{ camera }}</h3>
+            <img class="feed" data-camera="{{ camera }}"
+                 src="{{ url_for('video_feed', camera=camera, stream=default_stream) }}" width="100%">
         </div>
+        {% endfor %}
         
         <div class="settings">
             <h2>Settings</h2>
@@ -177,6 +393,14 @@ class WebInterface:
                 document.getElementById('nightSensitivity').value = data.sensitivity.night;
             });
 
+        // Switching the image source drops the old stream, so its encoder idles again
+        function setStream(stream) {
+            document.querySelectorAll('img.feed').forEach(img => {
+                img.src = '/video_feed?camera=' + encodeURIComponent(img.dataset.camera) +
+                          '&stream=' + encodeURIComponent(stream);
+            });
+        }
+
         function saveSettings() {
             const settings = {
                 monitoring_hours: {
@@ -212,6 +436,11 @@ class WebInterface:
 </html>
             """)
             
+        # Start the shared frame encoders before accepting viewers (they idle until watched)
+        for hubs in self.hubs.values():
+            for hub in hubs.values():
+                hub.start()
+        
         # Run Flask app in a separate thread
         thread = threading.Thread(target=self.app.run, kwargs={
             'host': host,